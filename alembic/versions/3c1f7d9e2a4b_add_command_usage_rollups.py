@@ -0,0 +1,52 @@
+"""add command usage rollups
+
+Revision ID: 3c1f7d9e2a4b
+Revises: ccf4bb99a5fa
+Create Date: 2026-10-17 12:04:31.512804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3c1f7d9e2a4b"
+down_revision = "ccf4bb99a5fa"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "command_usage_rollups",
+        sa.Column("command_name", sa.String(), nullable=False),
+        sa.Column("scope", sa.String(), nullable=False),
+        sa.Column("_target", sa.BigInteger(), nullable=False),
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("command_name", "scope", "_target", "bucket"),
+    )
+
+    # backfill from the existing command logs, buckets are whole UTC hours. Logs without a
+    # date count as now, like the partitioning migration dates them
+    op.execute(
+        """
+        INSERT INTO command_usage_rollups (command_name, scope, _target, bucket, count)
+        SELECT command_name, 'user', _user,
+               date_trunc('hour', coalesce(date, now()) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+               count(*)
+        FROM command_logs
+        GROUP BY 1, 2, 3, 4
+        UNION ALL
+        SELECT command_name, 'guild', _guild,
+               date_trunc('hour', coalesce(date, now()) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+               count(*)
+        FROM command_logs
+        WHERE _guild IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("command_usage_rollups")
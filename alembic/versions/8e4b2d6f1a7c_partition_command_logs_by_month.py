@@ -0,0 +1,115 @@
+"""partition command_logs by month
+
+Revision ID: 8e4b2d6f1a7c
+Revises: 3c1f7d9e2a4b
+Create Date: 2026-10-17 14:21:09.318442
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8e4b2d6f1a7c"
+down_revision = "3c1f7d9e2a4b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE command_logs RENAME TO command_logs_unpartitioned")
+    op.execute(
+        "ALTER TABLE command_logs_unpartitioned "
+        "RENAME CONSTRAINT command_logs_pkey TO command_logs_unpartitioned_pkey"
+    )
+    op.execute("ALTER SEQUENCE command_logs__command_log_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE command_logs (
+            _command_log INTEGER NOT NULL DEFAULT nextval('command_logs__command_log_seq'),
+            command_name VARCHAR NOT NULL,
+            cog VARCHAR NOT NULL,
+            _user BIGINT NOT NULL,
+            _guild BIGINT,
+            date TIMESTAMP WITH TIME ZONE NOT NULL,
+            args TEXT,
+            PRIMARY KEY (_command_log, date)
+        ) PARTITION BY RANGE (date)
+        """
+    )
+    op.execute("CREATE TABLE command_logs_default PARTITION OF command_logs DEFAULT")
+
+    # one partition per UTC month, from the oldest log up to two months ahead
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            month TIMESTAMP := date_trunc(
+                'month',
+                coalesce((SELECT min(date) FROM command_logs_unpartitioned), now())
+                AT TIME ZONE 'UTC'
+            );
+        BEGIN
+            WHILE month < date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months'
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF command_logs FOR VALUES FROM (%L) TO (%L)',
+                    'command_logs_' || to_char(month, '"y"YYYY"m"MM'),
+                    month AT TIME ZONE 'UTC',
+                    (month + interval '1 month') AT TIME ZONE 'UTC'
+                );
+                month := month + interval '1 month';
+            END LOOP;
+        END $$
+        """
+    )
+
+    op.execute(
+        """
+        INSERT INTO command_logs (_command_log, command_name, cog, _user, _guild, date, args)
+        SELECT _command_log, command_name, cog, _user, _guild, coalesce(date, now()), args
+        FROM command_logs_unpartitioned
+        """
+    )
+    op.execute("DROP TABLE command_logs_unpartitioned")
+    op.execute(
+        "ALTER SEQUENCE command_logs__command_log_seq OWNED BY command_logs._command_log"
+    )
+    op.create_index(
+        "ix_command_logs_command_name_date", "command_logs", ["command_name", "date"]
+    )
+
+
+def downgrade():
+    op.execute("ALTER TABLE command_logs RENAME TO command_logs_partitioned")
+    op.execute(
+        "ALTER TABLE command_logs_partitioned "
+        "RENAME CONSTRAINT command_logs_pkey TO command_logs_partitioned_pkey"
+    )
+    op.execute("ALTER SEQUENCE command_logs__command_log_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE command_logs (
+            _command_log INTEGER NOT NULL DEFAULT nextval('command_logs__command_log_seq'),
+            command_name VARCHAR NOT NULL,
+            cog VARCHAR NOT NULL,
+            _user BIGINT NOT NULL,
+            _guild BIGINT,
+            date TIMESTAMP WITH TIME ZONE,
+            args TEXT,
+            PRIMARY KEY (_command_log)
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO command_logs (_command_log, command_name, cog, _user, _guild, date, args)
+        SELECT _command_log, command_name, cog, _user, _guild, date, args
+        FROM command_logs_partitioned
+        """
+    )
+    # also drops all partitions
+    op.execute("DROP TABLE command_logs_partitioned")
+    op.execute(
+        "ALTER SEQUENCE command_logs__command_log_seq OWNED BY command_logs._command_log"
+    )
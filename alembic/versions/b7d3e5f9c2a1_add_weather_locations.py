@@ -0,0 +1,34 @@
+"""add weather locations
+
+Revision ID: b7d3e5f9c2a1
+Revises: 8e4b2d6f1a7c
+Create Date: 2026-10-17 18:42:53.104219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7d3e5f9c2a1"
+down_revision = "8e4b2d6f1a7c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "weather_locations",
+        sa.Column("query", sa.String(), nullable=False),
+        sa.Column("city_id", sa.Integer(), nullable=False),
+        sa.Column("city", sa.String(), nullable=False),
+        sa.Column("country", sa.String(), nullable=False),
+        sa.Column("lat", sa.Float(), nullable=False),
+        sa.Column("lon", sa.Float(), nullable=False),
+        sa.Column("date", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("query"),
+    )
+
+
+def downgrade():
+    op.drop_table("weather_locations")
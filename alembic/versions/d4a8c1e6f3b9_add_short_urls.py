@@ -0,0 +1,31 @@
+"""add short urls
+
+Revision ID: d4a8c1e6f3b9
+Revises: b7d3e5f9c2a1
+Create Date: 2026-10-17 19:05:12.471830
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d4a8c1e6f3b9"
+down_revision = "b7d3e5f9c2a1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "short_urls",
+        sa.Column("long_url", sa.String(), nullable=False),
+        sa.Column("domain", sa.String(), nullable=False),
+        sa.Column("link", sa.String(), nullable=False),
+        sa.Column("date", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("long_url", "domain"),
+    )
+
+
+def downgrade():
+    op.drop_table("short_urls")
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import typing
 from collections import Counter
@@ -12,7 +13,14 @@ from const import CUSTOM_EMOJI
 from help_command import EmbedHelpCommand
 from log import MessageableHandler
 from models import GuildCog
-from util import safe_send, ChannelLocker, TrieNode
+from util import (
+    safe_send,
+    ChannelLocker,
+    BannedWordsAutomaton,
+    BatchWriter,
+    MediaCache,
+    HttpPool,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -52,16 +60,69 @@ class BotwBot(commands.Bot):
         self.whitelist = set()  # guild.id
         self.custom_emoji = {}  # name -> Emoji instance
         self.blocked_users = {}  # guild.id -> set(user.id)
-        self.banned_words_trie = None
+        # empty until on_ready loads the banned words, commands may update it before that
+        self.banned_words = BannedWordsAutomaton()
 
         self.channel_locker = ChannelLocker()
+        # cogs borrow their aiohttp sessions from here
+        http_pool_config = self.config.get("http_pool", {})
+        self.http_pool = HttpPool(
+            limit=http_pool_config.get("limit", 100),
+            limit_per_host=http_pool_config.get("limit_per_host", 20),
+        )
+        self.command_log_writer = BatchWriter(
+            self._write_command_logs, name="command log writer"
+        )
+
+        media_cache_config = self.config.get("media_cache", {})
+        self.media_cache = MediaCache(
+            media_cache_config.get("directory", "cache/media"),
+            media_cache_config.get("max_size", 500) * 10**6,
+        )
 
         GuildCog.inject_bot(self)
 
         self.privileged_cogs_cache: dict[str, set[int]] = {}
 
+    async def setup_hook(self):
+        self.command_log_writer.start()
+
+    async def close(self):
+        await super().close()
+        await self.command_log_writer.stop()
+        self.media_cache.save_index()
+        await self.http_pool.close()
+
+    async def _write_command_logs(self, rows: list[dict]) -> None:
+        async with self.Session() as session:
+            await db.insert_command_logs(session, rows)
+            await db.upsert_command_usage_rollups(session, rows)
+            await session.commit()
+
     def contains_banned_word(self, message: str) -> bool:
-        return self.banned_words_trie.match_message(message)
+        return self.banned_words.match_message(message)
+
+    def update_banned_words(
+        self, added: typing.Iterable[str] = (), removed: typing.Iterable[str] = ()
+    ) -> None:
+        """
+        Applies a delta to the banned words in place. Nothing in here awaits, so matching can never
+        observe a partially updated automaton.
+        """
+        for word in removed:
+            self.banned_words.discard(word)
+
+        for word in added:
+            self.banned_words.add(word)
+
+        self.banned_words.compile()
+
+    async def replace_banned_words(self, words: list[str]) -> None:
+        """
+        Builds an automaton for the new list in a worker thread and swaps it in once it is
+        complete. Matching keeps using the old automaton in the meantime.
+        """
+        self.banned_words = await asyncio.to_thread(BannedWordsAutomaton.build, words)
 
     async def on_ready(self):
         await self.change_presence(activity=discord.Game("with Bini"))
@@ -85,7 +146,7 @@ class BotwBot(commands.Bot):
                     blocked_users_in_guild.add(blocked_user._user)
 
                 banned_words = await db.get_banned_words(session)
-                self.banned_words_trie = TrieNode.build(
+                self.banned_words = BannedWordsAutomaton.build(
                     [banned_word.word for banned_word in banned_words]
                 )
                 logger.info("Loaded %d banned words", len(banned_words))
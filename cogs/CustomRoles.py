@@ -1,7 +1,6 @@
 import asyncio
 import logging
 
-import aiohttp
 import discord
 from discord import Embed, Color, Member
 from discord.ext import tasks, commands
@@ -48,16 +47,16 @@ class CustomRoles(CustomCog, AinitMixin):
     def __init__(self, bot):
         super().__init__(bot)
 
-        self.session = aiohttp.ClientSession()
+        self.session = self.bot.http_pool.session()
 
         CustomRole.inject_bot(bot)
         CustomRoleSettings.inject_bot(bot)
 
         self._role_removal_loop.start()
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self._role_removal_loop.stop()
-        asyncio.create_task(self.session.close())
+        await self.session.close()
 
     async def _download_emoji(self, emoji_url: str):
         async with self.session.get(emoji_url) as response:
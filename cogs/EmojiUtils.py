@@ -3,7 +3,6 @@ import logging
 import typing
 from pathlib import Path
 
-import aiohttp
 import discord
 import pendulum
 from discord.ext import commands
@@ -32,12 +31,12 @@ class EmojiUtils(commands.Cog):
         self.bot = bot
         self.cooldowns = {}  # guild.id -> cooldown
         self.last_updates = {}  # guild.id -> on_guild_emojis_update after obj
-        self.session = aiohttp.ClientSession()
+        self.session = self.bot.http_pool.session()
 
         EmojiSettings.inject_bot(bot)
 
-    def cog_unload(self):
-        asyncio.create_task(self.session.close())
+    async def cog_unload(self):
+        await self.session.close()
 
     async def _send_emoji_list(self, channel: discord.TextChannel, after=None):
         emojis = after if after else channel.guild.emojis
@@ -1,12 +1,10 @@
 import abc
 import asyncio
-import collections
 import dataclasses
-import itertools
 import json
 import logging
+import time
 import typing
-from io import BytesIO
 from os.path import basename
 from typing import Optional
 from urllib.parse import urlparse
@@ -15,7 +13,6 @@ import aiohttp
 import discord
 import yarl
 from aiohttp.typedefs import LooseCookies
-from discord import File
 from discord.ext import commands
 from regex import regex
 from yarl import URL
@@ -29,9 +26,15 @@ from util import (
     auto_help,
     ReactingRetryingSession,
     ExceededMaximumRetries,
+    CircuitOpenError,
+    SizeCappedDownloader,
+    MediaBuffer,
+    normalize_media_url,
+    pack_attachments,
     LeastRecentlyUsed,
     PrivilegedCog,
     PrivilegedCogNoPermissions,
+    SingleFlight,
 )
 
 logger = logging.getLogger(__name__)
@@ -132,13 +135,10 @@ class InstagramExtractorV2(InstagramExtractor):
         return urls
 
 
-FileStub = collections.namedtuple("FileStub", "filename bytes")
-
-
 @dataclasses.dataclass
 class IGPostResult:
     urls: list[str] = dataclasses.field(default_factory=list)
-    files: list[FileStub] = dataclasses.field(default_factory=list)
+    files: list[MediaBuffer] = dataclasses.field(default_factory=list)
     exceptions: list[ExceededMaximumRetries] = dataclasses.field(default_factory=list)
 
 
@@ -157,35 +157,88 @@ def shortcode_to_media_id(
     return result
 
 
-class InstagramCookieJarProvider:
-    def __init__(self, cookie_jar):
-        self._cookie_db: list[tuple[str, dict[str, str]]] = []
-        self._cookie_jar: OneTimeCookieJar = cookie_jar
-        self._generator = self.generator()
+@dataclasses.dataclass
+class InstagramCookie:
+    account_name: str
+    cookies: dict[str, str]
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_used: float = 0.0
+    last_failure: typing.Optional[float] = None
+    cooldown_until: float = 0.0
+
+    @property
+    def success_rate(self) -> typing.Optional[float]:
+        requests = self.successes + self.failures
+        return self.successes / requests if requests else None
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+
+class InstagramCookieScheduler:
+    """
+    Hands out the least recently used cookie that is not cooling down. Every failure puts a
+    cookie on a cooldown that doubles with each consecutive failure, a success lifts it. If all
+    cookies are cooling down, the one whose cooldown ends first is used.
+    """
+
+    COOLDOWN_BASE = 60
+    COOLDOWN_MAX = 6 * 60 * 60
+
+    def __init__(self):
+        self.cookies: list[InstagramCookie] = []
 
     def load_cookies(self, cookie_file):
         with open(cookie_file, "r") as f:
             contents: dict[str, list[list[str]]] = json.load(f)
-            cookies = contents.get("cookies", [])
-            logger.info("Loaded %d Instagram cookies", len(cookies))
 
-            for account_name, session_id in contents["cookies"]:
-                self._cookie_db.append(
-                    (
-                        account_name,
-                        {
-                            "sessionid": session_id,
-                        },
-                    )
-                )
+        # keep the health of accounts that are still in the file
+        known = {cookie.account_name: cookie for cookie in self.cookies}
+        self.cookies = []
+
+        for account_name, session_id in contents.get("cookies", []):
+            cookie = known.get(account_name) or InstagramCookie(account_name, {})
+            cookie.cookies = {"sessionid": session_id}
+            self.cookies.append(cookie)
+
+        logger.info("Loaded %d Instagram cookies", len(self.cookies))
+
+    def acquire(self) -> typing.Optional[InstagramCookie]:
+        if not self.cookies:
+            return None
+
+        now = time.monotonic()
+
+        if healthy := [cookie for cookie in self.cookies if cookie.is_healthy(now)]:
+            cookie = min(healthy, key=lambda c: c.last_used)
+        else:
+            cookie = min(self.cookies, key=lambda c: c.cooldown_until)
+
+        cookie.last_used = now
+        return cookie
+
+    def report_success(self, cookie: typing.Optional[InstagramCookie]) -> None:
+        if cookie is None:
+            return
+
+        cookie.successes += 1
+        cookie.consecutive_failures = 0
+        cookie.cooldown_until = 0.0
 
-    def repopulate(self) -> str:
-        account_name, next_cookie = next(self._generator)
-        self._cookie_jar.force_update_cookies(cookies=next_cookie)
-        return account_name
+    def report_failure(self, cookie: typing.Optional[InstagramCookie]) -> None:
+        if cookie is None:
+            return
 
-    def generator(self):
-        yield from itertools.cycle(self._cookie_db)
+        now = time.monotonic()
+        cookie.failures += 1
+        cookie.consecutive_failures += 1
+        cookie.last_failure = now
+        cookie.cooldown_until = now + min(
+            self.COOLDOWN_BASE * 2 ** (cookie.consecutive_failures - 1),
+            self.COOLDOWN_MAX,
+        )
 
 
 class Instagram(PrivilegedCog):
@@ -195,24 +248,31 @@ class Instagram(PrivilegedCog):
     FILESIZE_MAX = 8 * 10**6  # 8 MB
     MAX_RETRIES = 3
     POST_CACHE_ENTRIES = 64
+    # posts of a single message that are fetched at the same time
+    MAX_CONCURRENT_FETCHES = 4
 
     def __init__(self, bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession(cookie_jar=OneTimeCookieJar())
+        self.session = self.bot.http_pool.session(cookie_jar=OneTimeCookieJar())
+        self.downloader = SizeCappedDownloader(
+            self.session, self.FILESIZE_MAX, max_tries=self.MAX_RETRIES
+        )
 
         config = self.bot.config["cogs"]["instagram"]
 
-        self.cookie_provider = InstagramCookieJarProvider(self.session.cookie_jar)
-        self.cookie_provider.load_cookies(config["cookies_file"])
+        self.cookies_file = config["cookies_file"]
+        self.cookie_scheduler = InstagramCookieScheduler()
+        self.cookie_scheduler.load_cookies(self.cookies_file)
 
         self.post_extractor = InstagramExtractorV2()
         self.post_cache = LeastRecentlyUsed(self.POST_CACHE_ENTRIES)
+        self._post_fetches = SingleFlight(keep=True)
 
         self.user_agent = config["user_agent"]
         self.app_id = config["app_id"]
 
-    def cog_unload(self):
-        asyncio.create_task(self.session.close())
+    async def cog_unload(self):
+        await self.session.close()
 
     async def get_post(self, message: discord.Message, url: str):
         headers = {
@@ -224,7 +284,10 @@ class Instagram(PrivilegedCog):
 
         url = self.INSTAGRAM_API_URL.format(media_id=shortcode_to_media_id(shortcode))
 
-        new_cookie = self.cookie_provider.repopulate()
+        # sent per request rather than set on the shared jar, fetches run concurrently
+        cookie = self.cookie_scheduler.acquire()
+        account_name = cookie.account_name if cookie else None
+
         try:
             async with ReactingRetryingSession(
                 self.MAX_RETRIES,
@@ -233,26 +296,42 @@ class Instagram(PrivilegedCog):
                 message=message,
                 emoji=self.bot.custom_emoji["RETRY"],
                 headers=headers,
+                cookies=cookie.cookies if cookie else None,
             ) as response:
                 try:
                     data = await response.json()
                 except aiohttp.ContentTypeError:
-                    logger.info("Request failed with cookie %s", new_cookie)
                     raise InstagramLoginException
-        except ExceededMaximumRetries:
-            logger.info("Request failed with cookie %s", new_cookie)
+        except CircuitOpenError:
+            # Instagram itself is failing, the cookie is not to blame
             raise
+        except (ExceededMaximumRetries, InstagramLoginException):
+            logger.info("Request failed with cookie %s", account_name)
+            self.cookie_scheduler.report_failure(cookie)
+            raise
+
+        if "spam" in data:
+            self.cookie_scheduler.report_failure(cookie)
+        else:
+            self.cookie_scheduler.report_success(cookie)
 
         return self.post_extractor.extract_media(data)
 
     async def get_post_and_media(
         self, message: discord.Message, url: str
     ) -> IGPostResult:
-        if cached := self.post_cache.get(url):
-            return cached
+        # only the media URLs are kept in memory, the files come from the media cache
+        media = self.post_cache.get(url)
+        if media is not None and not all(
+            normalize_media_url(media_url, drop_query=True) in self.bot.media_cache
+            for media_url in media
+        ):
+            # the signed URLs expire, so they are only reused while all files are cached
+            del self.post_cache[url]
+            media = None
 
         try:
-            media = await self.get_post(message, url)
+            media = media or await self.get_post(message, url)
         except InstagramSpamException:
             raise commands.BadArgument(
                 "We are being rate limited by Instagram. Try again later."
@@ -267,6 +346,10 @@ class Instagram(PrivilegedCog):
             raise commands.BadArgument(
                 "Instagram broke :poop: Bot owner has been notified."
             )
+        except CircuitOpenError:
+            raise commands.BadArgument(
+                "Instagram is not responding at the moment. Please try again later."
+            )
         except ExceededMaximumRetries as e:
             raise commands.BadArgument(
                 f"Failed fetching the Instagram post at `{e.url}` multiple ({e.tries}) times. Please try again later."
@@ -274,22 +357,24 @@ class Instagram(PrivilegedCog):
 
         ig_post_result = IGPostResult()
 
-        async def get_media(url: str) -> typing.Union[FileStub, str]:
-            async with ReactingRetryingSession(
-                self.MAX_RETRIES,
-                self.session.get,
+        async def get_media(url: str) -> typing.Union[MediaBuffer, str]:
+            # Instagram signs its CDN URLs per request
+            key = normalize_media_url(url, drop_query=True)
+            if (cached := self.bot.media_cache.get(key)) is not None:
+                return cached
+
+            result = await self.downloader.download(
                 yarl.URL(url, encoded=True),
                 message=message,
                 emoji=self.bot.custom_emoji["RETRY"],
-            ) as response:
-                filename = basename(urlparse(url).path)
-                bytes = await response.read()
-                filesize = BytesIO(bytes).getbuffer().nbytes
+            )
+            filename = basename(urlparse(url).path)
 
-                if self.FILESIZE_MIN < filesize < self.FILESIZE_MAX:
-                    return FileStub(filename, bytes)
-                else:
-                    return url
+            if result.complete and self.FILESIZE_MIN < len(result.data):
+                await self.bot.media_cache.put(key, filename, result.data)
+                return MediaBuffer(filename, result.data)
+            else:
+                return url
 
         results = await asyncio.gather(
             *[get_media(url) for url in media], return_exceptions=True
@@ -301,20 +386,48 @@ class Instagram(PrivilegedCog):
             if type(result) == str:
                 ig_post_result.urls.append(result)
                 dont_cache = True
-            elif type(result) == FileStub:
+            elif type(result) == MediaBuffer:
                 ig_post_result.files.append(result)
-            elif type(result) == ExceededMaximumRetries:
+            elif isinstance(result, ExceededMaximumRetries):
                 ig_post_result.exceptions.append(result)
                 dont_cache = True
 
         if not dont_cache:
-            self.post_cache[url] = ig_post_result
+            self.post_cache[url] = media
 
         return ig_post_result
 
+    def fetch_post(
+        self,
+        message: discord.Message,
+        url: str,
+        semaphore: typing.Optional[asyncio.Semaphore] = None,
+    ) -> asyncio.Task:
+        """
+        Starts fetching a post and its media in the background, unless that post is already being
+        fetched. Everyone asking for the same post shares one fetch until it is forgotten.
+        """
+
+        async def fetch():
+            if semaphore is None:
+                return await self.get_post_and_media(message, url)
+
+            async with semaphore:
+                return await self.get_post_and_media(message, url)
+
+        return self._post_fetches.start(url, fetch)
+
+    def forget_post_fetch(self, url: str, task: asyncio.Task) -> None:
+        """Drops a fetch once its result was used, or once it finishes if it is still running."""
+        self._post_fetches.forget(url, task)
+
     @log_usage(command_name="ig_show")
     async def show_media(self, ctx, url):
-        ig_post_result = await self.get_post_and_media(ctx.message, url)
+        task = self.fetch_post(ctx.message, url)
+        try:
+            ig_post_result = await self._post_fetches.wait(task)
+        finally:
+            self.forget_post_fetch(url, task)
 
         # remove discord's default instagram embed
         try:
@@ -326,9 +439,9 @@ class Instagram(PrivilegedCog):
         for chunk in url_chunks:
             await ctx.send("\n".join(chunk))
 
-        for file_stub in ig_post_result.files:
-            filename, bytes_ = file_stub
-            await ctx.send(files=[File(BytesIO(bytes_), filename=filename)])
+        filesize_limit = ctx.guild.filesize_limit if ctx.guild else self.FILESIZE_MAX
+        for message in pack_attachments(ig_post_result.files, filesize_limit):
+            await ctx.send(files=[file.to_file() for file in message])
 
         if len(ig_post_result.exceptions) > 0:
             await ctx.send(
@@ -362,12 +475,35 @@ class Instagram(PrivilegedCog):
     @instagram.command()
     @commands.is_owner()
     async def reload(self, ctx):
-        with open(self.cookies_file, "r") as f:
-            cookies = json.load(f)
+        self.cookie_scheduler.load_cookies(self.cookies_file)
+
+        await ctx.send(f"Loaded {len(self.cookie_scheduler.cookies)} cookies")
+
+    @instagram.command(brief="Shows the health of the Instagram cookies")
+    @commands.is_owner()
+    async def cookies(self, ctx):
+        now = time.monotonic()
+        embed = discord.Embed(title="Instagram Cookies")
+
+        for cookie in self.cookie_scheduler.cookies:
+            success_rate = cookie.success_rate
+            lines = [
+                f"Success rate: {success_rate:.0%}"
+                if success_rate is not None
+                else "Success rate: -",
+                f"Requests: {cookie.successes} ok, {cookie.failures} failed",
+                f"Consecutive failures: {cookie.consecutive_failures}",
+            ]
+
+            if cookie.last_failure is not None:
+                lines.append(f"Last failure: {now - cookie.last_failure:.0f}s ago")
 
-        self.session.cookie_jar.force_update_cookies(cookies=cookies)
+            if not cookie.is_healthy(now):
+                lines.append(f"Cooling down for {cookie.cooldown_until - now:.0f}s")
 
-        await ctx.send(f"Loaded {len(self.session.cookie_jar)} cookies")
+            embed.add_field(name=cookie.account_name, value="\n".join(lines))
+
+        await ctx.send(embed=embed)
 
     @commands.Cog.listener("on_message")
     async def on_message(self, message):
@@ -393,13 +529,21 @@ class Instagram(PrivilegedCog):
                 message, emoji=UNICODE_EMOJI["INSPECT"]
             ).prompt(ctx)
             if confirm:
-                async with (await self.bot.channel_locker.get(message.channel)):
-                    async with ctx.typing():
-                        for url in urls:
-                            try:
-                                await self.show_media(ctx, url)
-                            except commands.BadArgument as error:
-                                await ctx.send(error)
+                # fetch all posts at once, but send them in the order they were linked
+                semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_FETCHES)
+                tasks = [self.fetch_post(message, url, semaphore) for url in urls]
+
+                try:
+                    async with (await self.bot.channel_locker.get(message.channel)):
+                        async with ctx.typing():
+                            for url in urls:
+                                try:
+                                    await self.show_media(ctx, url)
+                                except commands.BadArgument as error:
+                                    await ctx.send(error)
+                finally:
+                    for url, task in zip(urls, tasks):
+                        self.forget_post_fetch(url, task)
 
     async def cog_before_invoke(self, ctx):
         await super().cog_before_invoke(ctx)
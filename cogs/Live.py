@@ -214,7 +214,7 @@ class Live(PrivilegedCog, AinitMixin):
         super().__init__()
 
         config = self.bot.config["cogs"]["live"]
-        self.session = aiohttp.ClientSession()
+        self.session = self.bot.http_pool.session()
         self.sync_stream_ws = SyncStreamLiveWebSocket(
             config["sync_stream_ws"], config["sync_stream_token"], self.session
         )
@@ -231,6 +231,7 @@ class Live(PrivilegedCog, AinitMixin):
 
     async def cog_unload(self):
         self.sync_stream_ws.stop()
+        await self.session.close()
 
     @auto_help
     @commands.group(
@@ -1,7 +1,9 @@
 import logging
 from functools import wraps
 
-from discord.ext import commands
+import discord
+import pendulum
+from discord.ext import commands, tasks
 from discord.ext.menus import MenuPages
 
 import db
@@ -13,21 +15,21 @@ def log_usage(command_name=None, log_args=True):
     def deco(func):
         @wraps(func)
         async def logged_func(self, ctx, *args, **kwargs):
-            async with self.bot.Session() as session:
-                arg_list = args if log_args else []
-                session.add(
-                    CommandLog(
-                        command_name=command_name or func.__name__,
-                        cog=type(self).__name__,
-                        _user=ctx.author.id,
-                        _guild=ctx.guild.id if ctx.guild else None,
-                        args=", ".join(
-                            [repr(arg) for arg in arg_list]
-                            + [f"{k}={str(v)}" for k, v in kwargs.items()]
-                        ),
-                    )
-                )
-                await session.commit()
+            # the row is written in the background by the bot's command log writer
+            arg_list = args if log_args else []
+            self.bot.command_log_writer.put(
+                {
+                    "command_name": command_name or func.__name__,
+                    "cog": type(self).__name__,
+                    "_user": ctx.author.id,
+                    "_guild": ctx.guild.id if ctx.guild else None,
+                    "date": pendulum.now("UTC"),
+                    "args": ", ".join(
+                        [repr(arg) for arg in arg_list]
+                        + [f"{k}={str(v)}" for k, v in kwargs.items()]
+                    ),
+                }
+            )
 
             await func(self, ctx, *args, **kwargs)
 
@@ -44,17 +46,78 @@ async def setup(bot):
 
 
 class Logging(commands.Cog):
+    # partitions are created this many months in advance
+    PARTITIONS_AHEAD = 2
+
     def __init__(self, bot):
         self.bot = bot
 
+        config = self.bot.config["logging"]
+        # months of command logs to keep, None keeps everything
+        self.retention_months = config.get("command_log_retention_months")
+        self.archive_partitions = config.get("archive_command_logs", False)
+
         CommandLog.inject_bot(bot)
 
+        self._partition_maintenance_loop.start()
+
+    def cog_unload(self):
+        self._partition_maintenance_loop.cancel()
+
+    @tasks.loop(hours=24)
+    async def _partition_maintenance_loop(self) -> None:
+        # an unhandled exception would stop the loop for good
+        try:
+            await self._maintain_partitions()
+        except Exception:
+            logger.exception("Could not maintain the command log partitions")
+
+    @_partition_maintenance_loop.before_loop
+    async def _partition_maintenance_loop_before(self):
+        await self.bot.wait_until_ready()
+
+    async def _maintain_partitions(self) -> None:
+        removed = []
+
+        async with self.bot.Session() as session:
+            created = await db.create_command_log_partitions(
+                session, self.PARTITIONS_AHEAD
+            )
+
+            if self.retention_months is not None:
+                before = (
+                    pendulum.now("UTC")
+                    .start_of("month")
+                    .subtract(months=self.retention_months)
+                )
+                removed = await db.drop_command_log_partitions(
+                    session, before, archive=self.archive_partitions
+                )
+
+            await session.commit()
+
+        if created or removed:
+            logger.info(
+                "created command log partitions %s, %s %s",
+                created,
+                "detached" if self.archive_partitions else "dropped",
+                removed,
+            )
+
     @commands.group()
     @commands.is_owner()
     async def usage(self, ctx):
         if not ctx.invoked_subcommand:
             await ctx.send_help(self.usage)
 
+    @usage.command(name="writer", brief="Shows stats about the command log writer")
+    async def usage_writer(self, ctx):
+        embed = discord.Embed(title="Command Log Writer")
+        for name, value in self.bot.command_log_writer.stats().items():
+            embed.add_field(name=name, value=str(value))
+
+        await ctx.send(embed=embed)
+
     @usage.command(name="command", aliases=["cmd"])
     async def usage_command(
         self, ctx, command_name: str, by: str = "user", weeks: int = 1
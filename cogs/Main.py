@@ -9,7 +9,7 @@ import db
 from botwbot import BotwBot
 from menu import Confirm
 from models import GuildSettings, GuildCog, BlockedUser, BannedWord
-from util import safe_send, safe_mention, detail_mention, ack
+from util import safe_send, safe_mention, detail_mention, ack, host_stats
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +18,11 @@ async def setup(bot: BotwBot):
     await bot.add_cog(Main(bot), guilds=await bot.get_guilds_for_cog(Main))
 
 
+def parse_banned_words(text: str) -> list[str]:
+    words = [token.strip().lower() for token in text.split(",")]
+    return list(dict.fromkeys(word for word in words if word))
+
+
 def owner_only_autocomplete(coro):
     @wraps(coro)
     async def wrapped(interaction: discord.Interaction, *args, **kwargs):
@@ -207,6 +212,30 @@ class Main(commands.Cog):
             activity=discord.Activity(type=activity_type, name=message)
         )
 
+    @commands.command(brief="Shows stats about the shared HTTP connection pool")
+    @commands.is_owner()
+    async def httpstats(self, ctx: commands.Context):
+        embed = discord.Embed(title="HTTP Connection Pool")
+        for name, value in self.bot.http_pool.stats().items():
+            embed.add_field(name=name, value=str(value))
+
+        await ctx.send(embed=embed)
+
+    @commands.command(brief="Shows circuit breakers and retries per host")
+    @commands.is_owner()
+    async def retrystats(self, ctx: commands.Context):
+        embed = discord.Embed(title="Retried Requests")
+        for host, stats in sorted(host_stats().items())[:25]:
+            embed.add_field(
+                name=host or "-",
+                value="\n".join(f"{name}: {value}" for name, value in stats.items()),
+            )
+
+        if not embed.fields:
+            embed.description = "No requests yet."
+
+        await ctx.send(embed=embed)
+
     @commands.command(brief="Block a user from using the bot")
     @commands.has_permissions(administrator=True)
     @ack
@@ -246,19 +275,59 @@ class Main(commands.Cog):
             raise commands.BadArgument("Attach a file.")
 
         text = (await banned_words_attachment.read()).decode("UTF-8")
-        tokenized = [token.strip() for token in text.split(",")]
+        words = parse_banned_words(text)
 
         async with self.bot.Session() as session:
             async with ctx.typing():
                 await db.delete_banned_words(session)
 
-                banned_words = [BannedWord(word=word.lower()) for word in tokenized]
+                banned_words = [BannedWord(word=word) for word in words]
                 session.add_all(banned_words)
 
                 await session.commit()
 
+                await self.bot.replace_banned_words(words)
+
+        await ctx.reply(f"Successfully loaded `{len(banned_words)}` banned words.")
+
+    @commands.group(name="bannedwords", brief="Manage banned words")
+    @commands.is_owner()
+    async def banned_words(self, ctx: commands.Context):
+        if not ctx.invoked_subcommand:
+            await ctx.send_help(self.banned_words)
+
+    @banned_words.command(name="add", brief="Adds comma separated banned words")
+    async def banned_words_add(self, ctx: commands.Context, *, words: str):
+        words = parse_banned_words(words)
+
+        async with self.bot.Session() as session:
+            existing = {
+                banned_word.word
+                for banned_word in await db.get_banned_words(session, words)
+            }
+            added = [word for word in words if word not in existing]
+
+            session.add_all([BannedWord(word=word) for word in added])
+            await session.commit()
+
+        self.bot.update_banned_words(added=added)
+
+        await ctx.reply(
+            f"Added `{len(added)}` banned words, `{len(self.bot.banned_words)}` in total."
+        )
+
+    @banned_words.command(name="remove", brief="Removes comma separated banned words")
+    async def banned_words_remove(self, ctx: commands.Context, *, words: str):
+        words = parse_banned_words(words)
+
+        async with self.bot.Session() as session:
+            removed = set(await db.delete_banned_words(session, words))
+            await session.commit()
+
+        self.bot.update_banned_words(removed=removed)
+
         await ctx.reply(
-            f"Successfully loaded `{len(banned_words)}` banned words. Don't forget to `.reload`."
+            f"Removed `{len(removed)}` banned words, `{len(self.bot.banned_words)}` left."
         )
 
     @commands.Cog.listener()
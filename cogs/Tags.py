@@ -1,16 +1,27 @@
+import asyncio
 import logging
 import random
+import time
 import typing
+from collections import Counter
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.menus import MenuPages
 
 import db
-from cogs import CustomCog, AinitMixin
+from cogs import CustomCog
 from menu import Confirm, TagListSource, SelectionMenu, DetailTagListSource
-from models import Tag
-from util import ordered_sublists, ratio, auto_help, BoolConverter
+from models import Tag, TagRecord
+from models.tag import normalize_tag_key
+from util import (
+    auto_help,
+    BoolConverter,
+    AhoCorasick,
+    NGramIndex,
+    deep_getsizeof,
+    SingleFlight,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +33,7 @@ async def setup(bot):
 def guild_has_tags():
     async def predicate(ctx):
         cog = ctx.bot.get_cog("Tags")
-        guild_tags = cog._get_tags(ctx.guild)
+        guild_tags = await cog._get_tags(ctx.guild)
 
         return len(guild_tags) > 0
 
@@ -36,7 +47,9 @@ class TagConverter(commands.Converter):
         """
         self.prompt = prompt_selection
 
-    async def convert(self, ctx, argument) -> typing.Union[Tag, typing.List[Tag]]:
+    async def convert(
+        self, ctx, argument
+    ) -> typing.Union[TagRecord, typing.List[TagRecord]]:
         """
         :return: A single tag if self.prompt, a list of tags whose triggers match otherwise
         :raises commands.BadArgument: if no matching tag was found
@@ -44,14 +57,13 @@ class TagConverter(commands.Converter):
 
         cog = ctx.bot.get_cog("Tags")
         try:
-            tag = [
-                tag for tag in cog._get_tags(ctx.guild) if tag.tag_id == int(argument)
-            ].pop()
+            tag = (await cog._get_tags(ctx.guild)).get(int(argument))
+        except ValueError:
+            tag = None
+
+        if tag is not None:
             return tag
-        except (
-            IndexError,
-            ValueError,
-        ):  # either argument is not an ID or it wasn't found
+        else:  # either argument is not an ID or it wasn't found
             # argument was not an ID, search triggers
             tags = await cog._get_tags_by_trigger(argument, ctx.guild)
 
@@ -71,59 +83,231 @@ class TagConverter(commands.Converter):
                 raise commands.BadArgument(f"Tag {argument} could not be found.")
 
 
-class Tags(CustomCog, AinitMixin):
+class GuildTags:
+    """
+    The tags of a single guild, stored as detached TagRecords and compiled for matching.
+
+    Tags are indexed by ID and by their normalized (trigger, reaction) pair. Exact triggers are
+    looked up by their lowercased text, triggers of in_msg tags are fed into a token-level
+    Aho-Corasick automaton and all triggers go into an n-gram index for fuzzy search. All indexes
+    are updated in place on add/edit/delete, so matching a message is a single pass over its
+    tokens regardless of the number of tags.
+    """
+
+    def __init__(self):
+        self._tags: dict[int, TagRecord] = {}
+        self._by_key: dict[tuple[str, str], set[int]] = {}
+        self._exact: dict[str, set[int]] = {}
+        self._in_msg = AhoCorasick()
+        self._fuzzy = NGramIndex()
+        self.last_used = time.monotonic()
+        # tag_id -> (normalized key, lowercased trigger, trigger tokens if in_msg) the tag is
+        # indexed under
+        self._indexed: dict[
+            int, tuple[tuple[str, str], str, typing.Optional[tuple[str, ...]]]
+        ] = {}
+
+    def __len__(self):
+        return len(self._tags)
+
+    def __iter__(self):
+        return iter(self._tags.values())
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def approximate_size(self) -> int:
+        """Approximate memory used by the tags and their indexes in bytes."""
+        return deep_getsizeof(self)
+
+    def get(self, tag_id: int) -> typing.Optional[TagRecord]:
+        return self._tags.get(tag_id)
+
+    def get_duplicates(self, trigger: str, reaction: str) -> list[TagRecord]:
+        tag_ids = self._by_key.get(normalize_tag_key(trigger, reaction), ())
+        return [self._tags[tag_id] for tag_id in tag_ids]
+
+    def add(self, tag: TagRecord) -> None:
+        self._tags[tag.tag_id] = tag
+
+        key = tag.normalized_key()
+        trigger = tag.trigger.lower()
+        tokens = tuple(trigger.split()) if tag.in_msg else None
+
+        self._by_key.setdefault(key, set()).add(tag.tag_id)
+        self._exact.setdefault(trigger, set()).add(tag.tag_id)
+        if tokens:
+            self._in_msg.add(tokens, tag.tag_id)
+        self._fuzzy.add(tag.tag_id, trigger)
+
+        self._indexed[tag.tag_id] = (key, trigger, tokens)
+
+    def remove(self, tag: TagRecord) -> None:
+        self._tags.pop(tag.tag_id, None)
+
+        try:
+            key, trigger, tokens = self._indexed.pop(tag.tag_id)
+        except KeyError:
+            return
+
+        _discard_from_index(self._by_key, key, tag.tag_id)
+        _discard_from_index(self._exact, trigger, tag.tag_id)
+
+        if tokens:
+            self._in_msg.discard(tokens, tag.tag_id)
+        self._fuzzy.discard(tag.tag_id)
+
+    def reindex(self, tag: TagRecord) -> None:
+        """Call after a tag's trigger, reaction or in_msg flag was edited."""
+        self.remove(tag)
+        self.add(tag)
+
+    def search(self, trigger: str, fuzzy: int = 0) -> list[TagRecord]:
+        """
+        Returns the tags whose trigger equals the given one or, if fuzzy is set, whose trigger has
+        a ratio() above fuzzy with it. Results are ordered by tag ID.
+        """
+        trigger = trigger.lower()
+
+        if not fuzzy:
+            tag_ids = self._exact.get(trigger, ())
+        else:
+            tag_ids = self._fuzzy.search(trigger, fuzzy)
+
+        return [self._tags[tag_id] for tag_id in sorted(tag_ids)]
+
+    def match(self, content: str) -> list[TagRecord]:
+        """
+        Returns all tags whose trigger equals the message or, for in_msg tags, whose trigger
+        tokens occur in order in the message.
+        """
+        content = content.lower()
+
+        found = set(self._exact.get(content, ()))
+        found.update(self._in_msg.matches(content.split()))
+
+        return [self._tags[tag_id] for tag_id in found]
+
+
+def _discard_from_index(index: dict[typing.Hashable, set[int]], key, tag_id: int):
+    tag_ids = index.get(key)
+    if tag_ids is not None:
+        tag_ids.discard(tag_id)
+        if not tag_ids:
+            del index[key]
+
+
+class Tags(CustomCog):
     FORMATTED_KEYS = [f"`{key}`" for key in Tag.EDITABLE]
+    USE_COUNT_FLUSH_INTERVAL = 60  # in seconds
+    USE_COUNT_FLUSH_THRESHOLD = 500  # distinct tags with pending increments
+    GUILD_IDLE_TIMEOUT = 60 * 60  # in seconds
+    EVICTION_INTERVAL = 5 * 60  # in seconds
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.tags = {}
+        # guild.id -> GuildTags, only for guilds whose tags were needed recently
+        self.tags: dict[int, GuildTags] = {}
+        # guild.id -> pending first load, shared by concurrent callers
+        self._tag_loads = SingleFlight()
+        self._loads = 0
+        self._evictions = 0
+
+        config = self.bot.config["cogs"].get("tags") or {}
+        self.guild_idle_timeout = config.get(
+            "guild_idle_timeout", self.GUILD_IDLE_TIMEOUT
+        )
+        self._evict_idle_guilds_loop.start()
+
+        # tag_id -> use count increments that have not been written to the db yet
+        self._use_counts = Counter()
+        self._use_counts_lock = asyncio.Lock()
+        self._flush_task: typing.Optional[asyncio.Task] = None
+        self._flush_use_counts_loop.start()
 
         Tag.inject_bot(self.bot)
+        TagRecord.inject_bot(self.bot)
 
-        super(AinitMixin).__init__()
+    async def cog_unload(self):
+        self._evict_idle_guilds_loop.cancel()
+        # lets a running flush finish, the final flush waits for it on the lock
+        self._flush_use_counts_loop.stop()
+        await self._flush_use_counts()
 
-    async def _ainit(self):
-        await self.bot.wait_until_ready()
+    async def _flush_use_counts(self):
+        async with self._use_counts_lock:
+            if not self._use_counts:
+                return
 
-        async with self.bot.Session() as session:
-            _tags = await db.get_tags(session)
+            deltas, self._use_counts = self._use_counts, Counter()
 
-            for tag in _tags:
-                if tag.guild:  # ignore guilds that the bot is not in
-                    self._get_tags(tag.guild).append(tag)
+            try:
+                async with self.bot.Session() as session:
+                    await db.increment_tag_use_counts(session, deltas)
+                    await session.commit()
+            except Exception:
+                # keep the increments around for the next flush
+                self._use_counts.update(deltas)
+                logger.exception("Could not flush use counts of %d tags", len(deltas))
+            except BaseException:
+                # cancelled, the increments are written by a later flush
+                self._use_counts.update(deltas)
+                raise
+            else:
+                logger.debug("Flushed use counts of %d tags", len(deltas))
+
+    @tasks.loop(seconds=USE_COUNT_FLUSH_INTERVAL)
+    async def _flush_use_counts_loop(self):
+        await self._flush_use_counts()
+
+    @tasks.loop(seconds=EVICTION_INTERVAL)
+    async def _evict_idle_guilds_loop(self):
+        cutoff = time.monotonic() - self.guild_idle_timeout
+        idle_guilds = [
+            guild_id
+            for guild_id, guild_tags in self.tags.items()
+            if guild_tags.last_used < cutoff
+        ]
 
-        logger.info(
-            f"# Initial tags from db: {sum([len(guild_tags) for guild_tags in self.tags.values()])}"
-        )
+        for guild_id in idle_guilds:
+            del self.tags[guild_id]
+
+        if idle_guilds:
+            self._evictions += len(idle_guilds)
+            logger.debug("Evicted tags of %d idle guilds", len(idle_guilds))
 
     async def _get_tags_by_trigger(self, trigger, guild, fuzzy=75):
-        if not fuzzy:
-            tags = [
-                tag
-                for tag in self._get_tags(guild)
-                if tag.trigger.lower() == trigger.lower()
-            ]
-        else:
-            tags = [
-                tag
-                for tag in self._get_tags(guild)
-                if ratio(tag.trigger.lower(), trigger.lower()) > fuzzy
-            ]
-        return tags
+        return (await self._get_tags(guild)).search(trigger, fuzzy)
 
     async def _get_duplicates(self, trigger, reaction, guild):
-        return [
-            tag
-            for tag in self._get_tags(guild)
-            if (
-                tag.trigger == trigger
-                and tag.reaction == reaction
-                and tag.guild == guild
-            )
-        ]
+        return (await self._get_tags(guild)).get_duplicates(trigger, reaction)
 
-    def _get_tags(self, guild: discord.Guild):
-        return self.tags.setdefault(guild.id, [])
+    async def _get_tags(self, guild: discord.Guild) -> GuildTags:
+        """
+        Returns the guild's tags, loading them from the db the first time they are needed.
+        Concurrent first loads of the same guild share a single query.
+        """
+        guild_tags = self.tags.get(guild.id)
+
+        if guild_tags is None:
+            guild_tags = await self._tag_loads.run(guild.id, self._load_tags, guild.id)
+
+        guild_tags.touch()
+        return guild_tags
+
+    async def _load_tags(self, guild_id: int) -> GuildTags:
+        async with self.bot.Session() as session:
+            records = await db.get_tag_records(session, guild_id=guild_id)
+
+        guild_tags = GuildTags()
+        for record in records:
+            guild_tags.add(record)
+
+        self.tags[guild_id] = guild_tags
+        self._loads += 1
+        logger.debug("Loaded %d tags of guild %d", len(guild_tags), guild_id)
+
+        return guild_tags
 
     async def _invoke_tag(self, channel, tag, info=False):
         if info:
@@ -133,9 +317,13 @@ class Tags(CustomCog, AinitMixin):
         else:
             await channel.send(tag.reaction)
 
-        async with self.bot.Session() as session:
-            await tag.increment_use_count(session)
-            await session.commit()
+        tag.use_count += 1
+        self._use_counts[tag.tag_id] += 1
+
+        if len(self._use_counts) >= self.USE_COUNT_FLUSH_THRESHOLD and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self._flush_use_counts())
 
     @auto_help
     @commands.group(
@@ -196,7 +384,7 @@ class Tags(CustomCog, AinitMixin):
                 session.add(tag)
                 await session.commit()
 
-                self._get_tags(ctx.guild).append(tag)
+                (await self._get_tags(ctx.guild)).add(TagRecord.from_model(tag))
                 await ctx.send(f"Tag `{tag.tag_id}` has been created.")
 
     @tag.command(aliases=["remove"], brief="Deletes given tag")
@@ -223,7 +411,7 @@ class Tags(CustomCog, AinitMixin):
             if confirm:
                 async with self.bot.Session() as session:
                     await tag.delete(session)
-                    self._get_tags(ctx.guild).remove(tag)
+                    (await self._get_tags(ctx.guild)).remove(tag)
                     await session.commit()
 
                 await ctx.send(f"Tag `{tag.tag_id}` was deleted.")
@@ -261,6 +449,8 @@ class Tags(CustomCog, AinitMixin):
                     value if key == "reaction" else tag.reaction,
                     ctx.guild,
                 )
+                # duplicates are detected case-insensitively, so the tag may match itself
+                matches = [match for match in matches if match.tag_id != tag.tag_id]
                 if len(matches) > 0:
                     raise commands.BadArgument(
                         f"This edit would create a duplicate of tag `{matches[0].tag_id}`."
@@ -272,6 +462,8 @@ class Tags(CustomCog, AinitMixin):
                 await tag.update(session, key, value)
                 await session.commit()
 
+            (await self._get_tags(ctx.guild)).reindex(tag)
+
             await ctx.send(f"Tag `{tag.tag_id}` was edited. Old {key}:\n{old_value}")
 
     @guild_has_tags()
@@ -284,7 +476,8 @@ class Tags(CustomCog, AinitMixin):
         Sends a list of all tags in the server.
         """
         pages = MenuPages(
-            source=TagListSource(self._get_tags(ctx.guild)), clear_reactions_after=True
+            source=TagListSource(list(await self._get_tags(ctx.guild))),
+            clear_reactions_after=True,
         )
         await pages.start(ctx)
 
@@ -294,7 +487,7 @@ class Tags(CustomCog, AinitMixin):
         Sends a detailed list of all tags in the server.
         """
         pages = MenuPages(
-            source=DetailTagListSource(self._get_tags(ctx.guild)),
+            source=DetailTagListSource(list(await self._get_tags(ctx.guild))),
             clear_reactions_after=True,
         )
         await pages.start(ctx)
@@ -338,7 +531,27 @@ class Tags(CustomCog, AinitMixin):
     @guild_has_tags()
     @tag.command(brief="Sends a random tag")
     async def random(self, ctx):
-        await self._invoke_tag(ctx, random.choice(self._get_tags(ctx.guild)), info=True)
+        await self._invoke_tag(
+            ctx, random.choice(list(await self._get_tags(ctx.guild))), info=True
+        )
+
+    @tag.command(brief="Shows stats about the tag cache")
+    @commands.is_owner()
+    async def stats(self, ctx):
+        resident_tags = sum(len(guild_tags) for guild_tags in self.tags.values())
+        resident_size = sum(
+            guild_tags.approximate_size() for guild_tags in self.tags.values()
+        )
+
+        embed = discord.Embed(title="Tag Cache Stats")
+        embed.add_field(name="Resident guilds", value=str(len(self.tags)))
+        embed.add_field(name="Resident tags", value=str(resident_tags))
+        embed.add_field(name="Memory", value=f"{resident_size / 1024:.1f} KiB")
+        embed.add_field(name="Guild loads", value=str(self._loads))
+        embed.add_field(name="Guild evictions", value=str(self._evictions))
+        embed.add_field(name="Idle timeout", value=f"{self.guild_idle_timeout} s")
+        embed.add_field(name="Pending use counts", value=str(len(self._use_counts)))
+        await ctx.send(embed=embed)
 
     @list.error
     @random.error
@@ -348,8 +561,8 @@ class Tags(CustomCog, AinitMixin):
 
     @commands.Cog.listener("on_message")
     async def on_message(self, message):
-        """Scan messages for tags to execute. As of now, the runtime is at worst O(words_in_message * number_tags),
-        which scales poorly. Probably need to implement a more efficient matching algorithm down the line.
+        """Scan messages for tags to execute. Matching is done by the guild's compiled GuildTags in
+        O(words_in_message + matches), independent of the number of tags.
 
         If multiple tags are found in one message, it chooses one at random."""
         if message.author.bot or not message.guild:
@@ -360,17 +573,7 @@ class Tags(CustomCog, AinitMixin):
         if ctx.valid:
             return
 
-        # no arg defaults to splitting on whitespace
-        tokens = message.content.lower().split()
-        found_tags = []
-        for tag in self._get_tags(ctx.guild):
-            if tag.trigger.lower() == message.content.lower():
-                found_tags.append(tag)
-            elif tag.in_msg:
-                tag_tokens = tag.trigger.lower().split()
-                sublists = ordered_sublists(tokens, len(tag_tokens))
-                if tag_tokens in sublists:
-                    found_tags.append(tag)
+        found_tags = (await self._get_tags(ctx.guild)).match(message.content)
 
         if len(found_tags) >= 1:
             chosen_tag = random.choice(found_tags)
@@ -1,5 +1,5 @@
 import asyncio
-import copy
+import dataclasses
 import logging
 import re
 import time
@@ -7,13 +7,12 @@ import typing
 from datetime import datetime, timedelta
 from io import BytesIO
 
-import aiohttp
 import discord
 import peony
-from discord import File
 from discord.ext import commands
 from discord.ext.menus import MenuPages
 from peony import PeonyClient, events
+from peony.data_processing import JSONData
 
 import db
 from cogs import CustomCog, AinitMixin
@@ -21,7 +20,17 @@ from const import UNICODE_EMOJI
 from menu import SimpleConfirm
 from menu import TwitterListSource
 from models import TwtSetting, TwtAccount, TwtSorting, TwtFilter
-from util import auto_help, ack, ReactingRetryingSession, ExceededMaximumRetries
+from util import (
+    auto_help,
+    ack,
+    ExceededMaximumRetries,
+    SizeCappedDownloader,
+    normalize_media_url,
+    RequestBatcher,
+    DelayQueue,
+    MediaBuffer,
+    pack_attachments,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +65,97 @@ def twitter_enabled():
     return commands.check(predicate)
 
 
+@dataclasses.dataclass
+class GuildRoute:
+    enabled: bool = True
+    default_channel_id: int = 0
+    channels_by_hashtag: dict[str, int] = dataclasses.field(default_factory=dict)
+    filters: set[str] = dataclasses.field(default_factory=set)
+
+
+class TwitterRoutingTable:
+    """
+    In-memory copy of the followed accounts, hashtag sortings, filters and settings of all guilds,
+    so routing a tweet to its channels needs no queries. Rebuilt whenever a guild changes them.
+    """
+
+    def __init__(self, accounts, sortings, filters, settings):
+        self.guilds_by_account: dict[str, set[int]] = {}
+        self.guilds: dict[int, GuildRoute] = {}
+
+        for account in accounts:
+            self.guilds_by_account.setdefault(account.account_id, set()).add(
+                account._guild
+            )
+
+        for setting in settings:
+            route = self.guilds.setdefault(setting._guild, GuildRoute())
+            route.enabled = setting.enabled
+            route.default_channel_id = setting._default_channel
+
+        for sorting in sortings:
+            route = self.guilds.setdefault(sorting._guild, GuildRoute())
+            route.channels_by_hashtag[sorting.hashtag] = sorting._channel
+
+        for filter_ in filters:
+            route = self.guilds.setdefault(filter_._guild, GuildRoute())
+            route.filters.add(filter_._filter)
+
+    @classmethod
+    async def load(cls, session) -> "TwitterRoutingTable":
+        return cls(
+            await db.get_twitter_accounts(session),
+            await db.get_twitter_sorting(session),
+            await db.get_twitter_filters(session),
+            await db.get_twitter_settings(session),
+        )
+
+    def get_servers(self, account_id, tweet_txt) -> list[int]:
+        """Returns the enabled guilds following the account that filter none of the words."""
+        tweet_words = set(tweet_txt.split())
+        servers = []
+
+        for guild_id in self.guilds_by_account.get(str(account_id), ()):
+            route = self.guilds.get(guild_id)
+            if route is None or (
+                route.enabled and route.filters.isdisjoint(tweet_words)
+            ):
+                servers.append(guild_id)
+
+        return servers
+
+    def get_channels(
+        self, servers, tags, get_channel: typing.Callable[[int], typing.Any]
+    ) -> list[discord.TextChannel]:
+        """
+        Returns the channels the hashtags are sorted into. If a guild sorts them into multiple
+        channels, its default channel is used instead, if it has one.
+        """
+        channel_list = []
+
+        for guild_id in servers:
+            route = self.guilds.get(guild_id)
+            if route is None:
+                continue
+
+            # multiple hashtags can map to the same channel
+            channels = {
+                channel
+                for tag in tags
+                if tag in route.channels_by_hashtag
+                and (channel := get_channel(route.channels_by_hashtag[tag]))
+            }
+
+            if len(channels) > 1 and (
+                default_channel := get_channel(route.default_channel_id)
+            ):
+                channel_list.append(default_channel)
+            else:
+                channel_list.extend(channels)
+
+        return channel_list
+
+
 class Twitter(CustomCog, AinitMixin):
     FILESIZE_MAX = 8 * 10**6  # 8 MB
     URL_REGEX = r"(https?://)?(www.)?twitter.com/(\S+)/status/(\d+)(\?s=\d+)?"
@@ -64,8 +164,17 @@ class Twitter(CustomCog, AinitMixin):
     KR_UTC_OFFSET = timedelta(hours=9)
     RESTART_STREAM_COOLDOWN = 2 * 60  # 2 minutes
     GET_TWEET_COOLDOWN = 15
+    STREAM_WORKERS = 4
+    STREAM_QUEUE_SIZE = 1000
     MAX_RETRIES = 3
     TWITTER_REQ_SIZE = 100
+    TWEET_BATCH_DELAY = 0.1
+    TWEET_REQ_PARAMS = {
+        "expansions": ["attachments.media_keys", "author_id"],
+        "media.fields": ["height", "type", "url", "width", "variants"],
+        "tweet.fields": ["created_at", "entities"],
+        "user.fields": ["username", "name"],
+    }
 
     def __init__(self, bot):
         super().__init__(bot)
@@ -75,8 +184,27 @@ class Twitter(CustomCog, AinitMixin):
         self.clientv2 = None
         # self.stream_task = None
         # self.restart_stream_task = None
-        self.session = aiohttp.ClientSession()
+        self.session = self.bot.http_pool.session()
+        self.downloader = SizeCappedDownloader(
+            self.session, self.FILESIZE_MAX, max_tries=self.MAX_RETRIES
+        )
         self.keys = self.bot.config["cogs"]["twitter"]
+        self._routing: typing.Optional[TwitterRoutingTable] = None
+        self._routing_lock = asyncio.Lock()
+        self._routing_version = 0
+        self.tweet_batcher = RequestBatcher(
+            self.get_tweets_v2,
+            max_batch_size=self.TWITTER_REQ_SIZE,
+            max_delay=self.TWEET_BATCH_DELAY,
+        )
+        # stream tweets are only hydrated after a cooldown, without holding up the stream
+        self.stream_queue = DelayQueue(
+            self.process_stream_tweet,
+            delay=self.GET_TWEET_COOLDOWN,
+            workers=self.STREAM_WORKERS,
+            max_size=self.STREAM_QUEUE_SIZE,
+            name="twitter stream queue",
+        )
         TwtSorting.inject_bot(self.bot)
         TwtSetting.inject_bot(self.bot)
         super(AinitMixin).__init__()
@@ -92,14 +220,35 @@ class Twitter(CustomCog, AinitMixin):
         )
         # self.restart_stream_task = asyncio.create_task(self.restart_stream_sub())
 
-    def cog_unload(self):
+    async def cog_unload(self):
         # if self.stream_task:
         #    self.stream_task.cancel()
 
         # if self.restart_stream_task:
         #    self.restart_stream_task.cancel()
 
-        asyncio.create_task(self.session.close())
+        self.stream_queue.stop()
+
+        await self.session.close()
+
+    async def get_routing(self) -> TwitterRoutingTable:
+        async with self._routing_lock:
+            if self._routing is not None:
+                return self._routing
+
+            version = self._routing_version
+            async with self.bot.Session() as session:
+                routing = await TwitterRoutingTable.load(session)
+
+            # don't keep a table that was invalidated while it was loading
+            if version == self._routing_version:
+                self._routing = routing
+
+            return routing
+
+    def invalidate_routing(self) -> None:
+        self._routing = None
+        self._routing_version += 1
 
     async def generate_accounts(self, session):
         accounts_list = set(await db.get_twitter_accounts_distinct(session))
@@ -108,6 +257,7 @@ class Twitter(CustomCog, AinitMixin):
 
     async def streaming(self):
         self.feed = self.client.stream.statuses.filter.post(follow=self.gen_accounts)
+        self.stream_queue.start()
 
         async with self.feed as stream:
             async for tweet in stream:
@@ -118,16 +268,14 @@ class Twitter(CustomCog, AinitMixin):
                     and "retweeted_status" not in tweet
                 ):
                     logger.debug(
-                        "Processing @%s - %s", tweet.user.screen_name, tweet.id_str
+                        "Queueing @%s - %s", tweet.user.screen_name, tweet.id_str
                     )
-                    async with self.bot.Session() as session:
-                        try:
-                            await asyncio.sleep(self.GET_TWEET_COOLDOWN)
-                            tweet_v2 = await self.get_tweet_v2(tweet.id)
-                            if tweet_v2:
-                                await self.manage_twt(tweet_v2, session)
-                        except Exception:
-                            logger.exception("Error processing tweet")
+                    self.stream_queue.put(tweet.id)
+
+    async def process_stream_tweet(self, tweet_id):
+        tweet = await self.get_tweet_v2(tweet_id)
+        if tweet:
+            await self.manage_twt(tweet)
 
     async def restart_stream(self):
         if self.restart_stream_task.done():
@@ -145,18 +293,15 @@ class Twitter(CustomCog, AinitMixin):
                 logger.info("Started stream with %d accounts", len(self.gen_accounts))
                 self.stream_task = asyncio.create_task(self.streaming())
 
-    async def manage_twt(self, tweet, session):
+    async def manage_twt(self, tweet):
         tags_list = await self.get_tweet_hashtags(tweet)
         if tags_list:
-            server_list_accs = await db.get_twitter_accounts(
-                session, account_id=tweet.includes.users[0].id
-            )
-            server_list_accs = [server._guild for server in server_list_accs]
+            routing = await self.get_routing()
             tweet_text = tweet["data"][0]["text"]
-            server_list = await self.get_servers(session, server_list_accs, tweet_text)
+            server_list = routing.get_servers(tweet.includes.users[0].id, tweet_text)
             if server_list:
-                channels_list = await self.get_channels(
-                    servers=server_list, tags=tags_list, session=session
+                channels_list = routing.get_channels(
+                    server_list, tags_list, self.bot.get_channel
                 )
                 tweet_txt, file_list = await self.create_post(tweet)
                 await self.manage_post_tweet(tweet_txt, file_list, channels_list)
@@ -199,60 +344,43 @@ class Twitter(CustomCog, AinitMixin):
         tweet_id,
         ctx=None,
     ):
-        tweet_req = {
-            "ids": [tweet_id],
-            "expansions": ["attachments.media_keys", "author_id"],
-            "media.fields": ["height", "type", "url", "width", "variants"],
-            "tweet.fields": ["created_at", "entities"],
-            "user.fields": ["username", "name"],
-        }
-        tweet = await self.clientv2.api.tweets.get(**tweet_req)
-        if "data" not in tweet:
-            return None
-
-        return tweet
+        """
+        Looks up a tweet through the batcher, so tweets requested around the same time share
+        one API call. Returns None if the tweet was not found.
+        """
+        return await self.tweet_batcher.get(str(tweet_id))
 
-    async def get_servers(self, session, server_list, tweet_txt):
-        server_set = set(server_list)
-        tweet_words = tweet_txt.split()
-        filtered_servers = await db.get_twitter_filters(
-            session, guild_list=server_list, word_list=tweet_words
-        )
-        disabled_servers = await db.get_twitter_settings(
-            session, guild_list=server_list, disabled_servers=True
+    async def get_tweets_v2(self, tweet_ids: list[str]) -> dict[str, JSONData]:
+        """
+        Looks up to TWITTER_REQ_SIZE tweets with one request and splits the response into one
+        single tweet response per id, with only that tweet's author and media included.
+        """
+        response = await self.clientv2.api.tweets.get(
+            ids=tweet_ids, **self.TWEET_REQ_PARAMS
         )
-        filtered_servers = set([srv._guild for srv in filtered_servers])
-        disabled_servers = set([srv._guild for srv in disabled_servers])
-        filtered_servers = filtered_servers | disabled_servers
+        if "data" not in response:
+            return {}
 
-        return list(server_set - filtered_servers)
+        includes = response.get("includes", {})
+        users = {user["id"]: user for user in includes.get("users", [])}
+        media = {item["media_key"]: item for item in includes.get("media", [])}
 
-    async def get_channels(self, servers, tags, session):
-        servers_channels_raw = await db.get_twitter_sorting(
-            session, tag_list=tags, guild_list=servers
-        )
-        servers_dict = {server._guild: set() for server in servers_channels_raw}
+        tweets = {}
+        for tweet_data in response["data"]:
+            tweet_includes = JSONData()
 
-        # get channels into dict per server
-        for server in servers_channels_raw:
-            # just one of each, so we use a set since
-            # multiple hashtags can map to the same channel
-            servers_dict[server._guild].add(server.channel)
+            if tweet_data.get("author_id") in users:
+                tweet_includes["users"] = [users[tweet_data["author_id"]]]
 
-        channel_list = []
-        for server_id in servers_dict:
-            if len(servers_dict[server_id]) > 1:
-                server_settings = await db.get_twitter_settings(
-                    session, guild_id=server_id
-                )
-                if server_settings.default_channel:
-                    channel_list.append(server_settings.default_channel)
-                else:
-                    channel_list.extend(servers_dict[server_id])
-            else:
-                channel_list.extend(servers_dict[server_id])
+            media_keys = tweet_data.get("attachments", {}).get("media_keys", [])
+            if tweet_media := [media[key] for key in media_keys if key in media]:
+                tweet_includes["media"] = tweet_media
 
-        return channel_list
+            tweets[tweet_data["id"]] = JSONData(
+                data=[tweet_data], includes=tweet_includes
+            )
+
+        return tweets
 
     async def create_post(self, tweet, is_stream=True, message=None):
         tweet_date = datetime.strptime(
@@ -301,38 +429,47 @@ class Twitter(CustomCog, AinitMixin):
 
     async def download_media(
         self, filename: str, url: str, message=None
-    ) -> tuple[typing.Optional[discord.File], str]:
+    ) -> tuple[typing.Optional[MediaBuffer], str]:
+        key = normalize_media_url(url)
+        if (media := self.bot.media_cache.get(key)) is not None:
+            return media, f"<{url}>"
+
         try:
-            async with ReactingRetryingSession(
-                self.MAX_RETRIES,
-                self.session.get,
-                url,
-                message=message,
-                emoji=self.bot.custom_emoji["RETRY"],
-            ) as response:
-                media_bytes = BytesIO(await response.read())
-
-                if media_bytes.getbuffer().nbytes < self.FILESIZE_MAX:
-                    return File(media_bytes, filename), f"<{url}>"
-                else:
-                    return None, url
+            result = await self.downloader.download(
+                url, message=message, emoji=self.bot.custom_emoji["RETRY"]
+            )
         except ExceededMaximumRetries as e:
             logger.info(
                 "Unable to download media '%s' after %d retries", e.url, e.tries
             )
             return None, url
 
+        if result.complete:
+            await self.bot.media_cache.put(key, filename, result.data)
+            return MediaBuffer(filename, result.data), f"<{url}>"
+        else:
+            return None, url
+
     async def manage_post_tweet(self, post, files, channels):
+        # all channels share the same media buffers
         post_list = []
         for channel in channels:
-            post_list.append(self.post_tweet(post, copy.deepcopy(files), channel))
+            post_list.append(self.post_tweet(post, files, channel))
         await asyncio.gather(*post_list)
 
-    async def post_tweet(self, post, files, channel):
+    async def post_tweet(self, post, files: list[MediaBuffer], channel):
+        messages = pack_attachments(files, channel.guild.filesize_limit)
+
         async with (await self.bot.channel_locker.get(channel)):
-            await channel.send(post)
-            for file in files:
-                await channel.send(file=file)
+            if post and not messages:
+                await channel.send(post)
+
+            # the text goes along with the first batch of files
+            for index, message in enumerate(messages):
+                await channel.send(
+                    post if index == 0 and post else None,
+                    files=[file.to_file() for file in message],
+                )
 
     @auto_help
     @commands.group(
@@ -361,6 +498,34 @@ class Twitter(CustomCog, AinitMixin):
             value=f"{(time_end - time_start) * 1000:.2f} ms",
             inline=False,
         )
+        batcher_stats = self.tweet_batcher.stats()
+        stats_embed.add_field(
+            name="Tweet Lookups",
+            value=f"{batcher_stats['requested']} lookups in {batcher_stats['batches']} requests",
+            inline=False,
+        )
+        stats_embed.add_field(
+            name="Media Downloads",
+            value="\n".join(
+                f"{name}: {value}" for name, value in self.downloader.stats().items()
+            ),
+            inline=False,
+        )
+        stats_embed.add_field(
+            name="Media Cache",
+            value="\n".join(
+                f"{name}: {value}"
+                for name, value in self.bot.media_cache.stats().items()
+            ),
+            inline=False,
+        )
+        stats_embed.add_field(
+            name="Stream Queue",
+            value="\n".join(
+                f"{name}: {value}" for name, value in self.stream_queue.stats().items()
+            ),
+            inline=False,
+        )
         await ctx.send(embed=stats_embed)
 
     @twitter.command(brief="Enable Twitter pic posting on server")
@@ -395,6 +560,8 @@ class Twitter(CustomCog, AinitMixin):
                 logger.info("%s (%d) enabled twitter", ctx.guild.name, ctx.guild.id)
             await session.commit()
 
+        self.invalidate_routing()
+
     @twitter.command(brief="Disable Twitter pic posting on server")
     @commands.has_permissions(administrator=True)
     @twitter_enabled()
@@ -414,6 +581,8 @@ class Twitter(CustomCog, AinitMixin):
             logger.info("%s (%d) disabled twitter", ctx.guild.name, ctx.guild.id)
             await session.commit()
 
+        self.invalidate_routing()
+
     @twitter.command(brief="Post tweet as if caught from stream")
     @commands.has_permissions(manage_messages=True)
     @twitter_enabled()
@@ -437,8 +606,10 @@ class Twitter(CustomCog, AinitMixin):
         tweet_ids = [tweet_url_.group(4) for tweet_url_ in tweet_urls]
 
         if tweet_ids:
-            for tweet_id in tweet_ids:
-                tweet = await self.get_tweet_v2(tweet_id, ctx)
+            tweets = await asyncio.gather(
+                *[self.get_tweet_v2(tweet_id, ctx) for tweet_id in tweet_ids]
+            )
+            for tweet in tweets:
                 if tweet:
                     logger.debug(
                         "Processing: @%s - %s in %s (%d)",
@@ -451,10 +622,10 @@ class Twitter(CustomCog, AinitMixin):
                     if channel:
                         channels_list = [channel]
                     else:
-                        async with self.bot.Session() as session:
-                            channels_list = await self.get_channels(
-                                servers=[ctx.guild.id], tags=tags_list, session=session
-                            )
+                        routing = await self.get_routing()
+                        channels_list = routing.get_channels(
+                            [ctx.guild.id], tags_list, self.bot.get_channel
+                        )
                     tweet_txt, file_list = await self.create_post(tweet)
                     await self.manage_post_tweet(tweet_txt, file_list, channels_list)
 
@@ -490,6 +661,8 @@ class Twitter(CustomCog, AinitMixin):
 
             await session.commit()
 
+        self.invalidate_routing()
+
     @twitter.group(
         name="add",
         brief="Add sorting strategies based on channels, tags, and accounts",
@@ -542,6 +715,8 @@ class Twitter(CustomCog, AinitMixin):
 
             await session.commit()
 
+        self.invalidate_routing()
+
     @add.command(
         name="filter",
         brief="Add a word filter to skip posting tweets",
@@ -569,6 +744,8 @@ class Twitter(CustomCog, AinitMixin):
             session.add(twitter_filter)
             await session.commit()
 
+        self.invalidate_routing()
+
     @add.command(name="account", brief="Add a twitter account for the server to follow")
     async def add_account(self, ctx, *accounts: commands.clean_content):
         """
@@ -609,6 +786,8 @@ class Twitter(CustomCog, AinitMixin):
 
             await session.commit()
 
+        self.invalidate_routing()
+
         logger.info(
             "%s (%d) added account(s) %s", ctx.guild.name, ctx.guild.id, accounts_found
         )
@@ -668,6 +847,8 @@ class Twitter(CustomCog, AinitMixin):
             )
             await session.commit()
 
+        self.invalidate_routing()
+
     @remove.command(
         name="account", brief="Add a twitter account for the server to follow"
     )
@@ -701,6 +882,8 @@ class Twitter(CustomCog, AinitMixin):
             await session.commit()
             # await self.restart_stream()
 
+        self.invalidate_routing()
+
     @remove.command(
         name="filter",
         brief="Remove a word filter to skip posting tweets",
@@ -725,6 +908,8 @@ class Twitter(CustomCog, AinitMixin):
             )
             await session.commit()
 
+        self.invalidate_routing()
+
     @twitter.group(
         name="show",
         brief="Show what accounts or sorting strategies currently enabled",
@@ -837,8 +1022,10 @@ class Twitter(CustomCog, AinitMixin):
             ).prompt(ctx)
             if confirm:
                 async with ctx.typing():
-                    for tweet_id in tweet_ids:
-                        tweet = await self.get_tweet_v2(tweet_id, ctx)
+                    tweets = await asyncio.gather(
+                        *[self.get_tweet_v2(tweet_id, ctx) for tweet_id in tweet_ids]
+                    )
+                    for tweet in tweets:
                         if tweet and "media" in tweet.includes:
                             try:
                                 await ctx.message.edit(suppress=True)
@@ -4,6 +4,8 @@ import logging
 import aiohttp
 from discord.ext import commands
 
+import db
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,15 +27,20 @@ class BearerAuth(aiohttp.BasicAuth):
 
 class UrlShortener(commands.Cog):
     SHORTEN_ENDPOINT = "https://api-ssl.bitly.com/v4/shorten"
+    MAX_CONCURRENT_REQUESTS = 20
 
     def __init__(self, bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
+        self.session = self.bot.http_pool.session()
         self.auth = BearerAuth(self.bot.config["cogs"]["urlshortener"]["access_token"])
         self.domain = self.bot.config["cogs"]["urlshortener"]["domain"]
+        # more requests than the pool allows per host would just wait for a connection
+        self.semaphore = asyncio.Semaphore(
+            min(self.MAX_CONCURRENT_REQUESTS, self.bot.http_pool.limit_per_host)
+        )
 
-    def cog_unload(self):
-        asyncio.create_task(self.session.close())
+    async def cog_unload(self):
+        await self.session.close()
 
     async def shorten_url(self, url):
         payload = {"domain": self.domain, "long_url": url}
@@ -50,6 +57,42 @@ class UrlShortener(commands.Cog):
                     data["description"] if "description" in data else data
                 )
 
+    async def shorten_urls(self, urls) -> dict[str, str]:
+        """
+        Returns the short links of the URLs that could be shortened. Links that were created before
+        are taken from the database, the others are requested concurrently and stored.
+        """
+        urls = list(dict.fromkeys(urls))
+
+        async with self.bot.Session() as session:
+            links = await db.get_short_urls(session, self.domain, urls)
+
+        missing = [url for url in urls if url not in links]
+
+        async def shorten(url):
+            async with self.semaphore:
+                return await self.shorten_url(url)
+
+        results = await asyncio.gather(
+            *[shorten(url) for url in missing], return_exceptions=True
+        )
+
+        new_links = {}
+        for url, result in zip(missing, results):
+            if isinstance(result, BitlyException):
+                continue
+            elif isinstance(result, Exception):
+                logger.error("Could not shorten '%s'", url, exc_info=result)
+            else:
+                new_links[url] = result
+
+        if new_links:
+            async with self.bot.Session() as session:
+                await db.add_short_urls(session, self.domain, new_links)
+                await session.commit()
+
+        return links | new_links
+
     @commands.group(brief="Shorten urls")
     async def url(self, ctx):
         if not ctx.invoked_subcommand:
@@ -61,11 +104,13 @@ class UrlShortener(commands.Cog):
         if len(urls) == 0:
             raise commands.BadArgument("Need at least one URL to shorten.")
 
+        links = await self.shorten_urls(urls)
+
         shortened_urls = []
-        for url in urls:
-            try:
-                shortened_urls.append(await self.shorten_url(url))
-            except BitlyException:
+        for url in dict.fromkeys(urls):
+            if url in links:
+                shortened_urls.append(links[url])
+            else:
                 await ctx.send(
                     f"Could not shorten `{url}`. Make sure that it is a valid URL."
                 )
@@ -1,13 +1,13 @@
-import asyncio
 import logging
+import typing
 
-import aiohttp
 import pendulum
 from discord import Embed
 from discord.ext import commands
 
 from const import WEATHER_EMOJI
-from util import celsius_to_fahrenheit, meters_to_miles, auto_help
+import db
+from util import celsius_to_fahrenheit, meters_to_miles, auto_help, Cached
 
 logger = logging.getLogger(__name__)
 
@@ -44,20 +44,35 @@ def icon_to_emoji(icon_string):
     return WEATHER_EMOJI[icon]
 
 
+def normalize_location(location):
+    return " ".join(location.lower().split())
+
+
 class OpenWeatherMapApiException(Exception):
     pass
 
 
+class Location(typing.NamedTuple):
+    city_id: int
+    city: str
+    country: str
+    lat: float
+    lon: float
+
+
 class Weather(commands.Cog):
     FIND_API_URL = "http://api.openweathermap.org/data/2.5/find"
     ONECALL_WEATHER_API_URL = "https://api.openweathermap.org/data/3.0/onecall"
 
     MSG_REQUEST_FAILED = "The request to OpenWeatherMap's API failed."
 
+    # forecasts are shared by locations within about a kilometer
+    COORDINATE_DIGITS = 2
+
     def __init__(self, bot):
         self.bot = bot
         self.app_id = self.bot.config["cogs"]["weather"]["app_id"]
-        self.session = aiohttp.ClientSession()
+        self.session = self.bot.http_pool.session()
 
     async def _make_request(self, method, route):
         async with self.session.request(method, route) as response:
@@ -71,27 +86,65 @@ class Weather(commands.Cog):
                 content = await response.json()
                 raise OpenWeatherMapApiException(content["message"])
 
-    async def _send_current_weather(self, session, ctx, location):
+    @Cached(size=1024, ignored_args=["0"], negative_ttl=3600)
+    async def geocode(self, query) -> typing.Optional[Location]:
+        """Looks up a normalized query in the database first and only asks the API once."""
+        async with self.bot.Session() as session:
+            stored = await db.get_weather_location(session, query)
+
+        if stored is not None:
+            return Location(
+                stored.city_id, stored.city, stored.country, stored.lat, stored.lon
+            )
+
+        # no session is held during the request
         response = await self._make_request(
             "get",
-            f"{Weather.FIND_API_URL}?appid={self.app_id}&q={location}",
+            f"{Weather.FIND_API_URL}?appid={self.app_id}&q={query}",
         )
 
         if len(response["list"]) == 0:
-            raise commands.BadArgument("Location not found")
+            return None
+
+        found = response["list"][0]
+        location = Location(
+            found["id"],
+            found["name"],
+            found["sys"]["country"],
+            found["coord"]["lat"],
+            found["coord"]["lon"],
+        )
+
+        async with self.bot.Session() as session:
+            await db.add_weather_location(session, query=query, **location._asdict())
+            await session.commit()
 
-        lat, lon = response["list"][0]["coord"].values()
+        return location
 
-        response_onecall = await self._make_request(
+    @Cached(size=256, ignored_args=["0"], ttl=600)
+    async def get_forecast(self, lat, lon):
+        """Takes coordinates rounded to COORDINATE_DIGITS, so nearby locations share a forecast."""
+        return await self._make_request(
             "get",
             f"{Weather.ONECALL_WEATHER_API_URL}?appid={self.app_id}&lon={lon}&lat={lat}&units=metric",
         )
+
+    async def _send_current_weather(self, session, ctx, location):
+        found = await self.geocode(normalize_location(location))
+
+        if found is None:
+            raise commands.BadArgument("Location not found")
+
+        response_onecall = await self.get_forecast(
+            round(found.lat, Weather.COORDINATE_DIGITS),
+            round(found.lon, Weather.COORDINATE_DIGITS),
+        )
         current = response_onecall["current"]
 
         content = {
-            "id": response["list"][0]["id"],
-            "city": response["list"][0]["name"],
-            "country": response["list"][0]["sys"]["country"],
+            "id": found.city_id,
+            "city": found.city,
+            "country": found.country,
             "main": current["weather"][0]["main"],
             "description": current["weather"][0]["description"],
             "pressure": current["pressure"],
@@ -104,7 +157,7 @@ class Weather(commands.Cog):
             "wind_deg": current["wind_deg"],
             "wind_speed": current["wind_speed"],
             "clouds": current["clouds"],
-            "uvi": current.pop("uvi", "N/A"),
+            "uvi": current.get("uvi", "N/A"),
             "rain": current["rain"]["1h"]
             if "rain" in current and "1h" in current["rain"]
             else 0,
@@ -149,8 +202,8 @@ class Weather(commands.Cog):
         await profiles.update(session, ctx.author, "location", location)
         await session.commit()
 
-    def cog_unload(self):
-        asyncio.create_task(self.session.close())
+    async def cog_unload(self):
+        await self.session.close()
 
     @auto_help
     @commands.group(
@@ -1,12 +1,10 @@
-import asyncio
 import logging
-from io import BytesIO
+import time
+import typing
 
-import aiohttp
-from discord import File
 from discord.ext import commands
 
-from util import auto_help
+from util import auto_help, Cached, MediaBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +13,11 @@ async def setup(bot):
     await bot.add_cog(WolframAlpha(bot))
 
 
+def normalize_query(query):
+    # only whitespace, queries are case-sensitive ("Mg" vs "mg")
+    return " ".join(query.split())
+
+
 class WolframAlpha(commands.Cog):
     RESULT_API_URL = "https://api.wolframalpha.com/v1/result"
     SIMPLE_API_URL = "https://api.wolframalpha.com/v1/simple"
@@ -22,13 +25,61 @@ class WolframAlpha(commands.Cog):
     MSG_REQUEST_FAILED = "The request to WolframAlpha's API failed."
     MSG_EMPTY_RESPONSE = "Try a different query. WolframAlpha is not cooperating."
 
+    # answers can depend on the time of the query, e.g. "time in Seoul"
+    RESULT_TTL = 15 * 60
+    IMAGE_TTL = 60 * 60
+
     def __init__(self, bot):
         self.bot = bot
         self.app_id = self.bot.config["cogs"]["wolframalpha"]["app_id"]
-        self.session = aiohttp.ClientSession()
+        self.session = self.bot.http_pool.session()
+
+    async def cog_unload(self):
+        await self.session.close()
+
+    async def _request(self, url, query) -> typing.Optional[bytes]:
+        async with self.session.get(
+            url, params={"appid": self.app_id, "i": query}
+        ) as response:
+            if response.status != 200:
+                return None
+
+            return await response.read()
+
+    @Cached(size=512, ignored_args=["0", "2"], ttl=RESULT_TTL)
+    async def get_result(self, key, query) -> typing.Optional[str]:
+        """
+        Cached by the normalized query as key, while the query is sent as it is. Failed requests
+        are not cached.
+        """
+        content = await self._request(WolframAlpha.RESULT_API_URL, query)
+        return content.decode() if content is not None else None
+
+    async def get_image(self, query) -> typing.Optional[MediaBuffer]:
+        """
+        Images are kept in the media cache by normalized query, under a key that changes every
+        IMAGE_TTL seconds so that outdated images age out of it. Concurrent requests for the same
+        image share one download.
+        """
+        bucket = int(time.time() // WolframAlpha.IMAGE_TTL)
+        key = f"wolframalpha:simple:{bucket}:{normalize_query(query)}"
+
+        return await self._get_image(key, query)
+
+    # the images themselves are kept in the media cache, not in memory
+    @Cached(size=0, ignored_args=["0", "2"])
+    async def _get_image(self, key, query) -> typing.Optional[MediaBuffer]:
+        if (cached := self.bot.media_cache.get(key)) is not None:
+            return cached
 
-    def cog_unload(self):
-        asyncio.create_task(self.session.close())
+        content = await self._request(WolframAlpha.SIMPLE_API_URL, query)
+        if content is None:
+            return None
+
+        if content:
+            await self.bot.media_cache.put(key, "wolfram.gif", content)
+
+        return MediaBuffer("wolfram.gif", content)
 
     @auto_help
     @commands.group(
@@ -45,32 +96,25 @@ class WolframAlpha(commands.Cog):
 
     @wolfram_alpha.command(aliases=["s"])
     async def simple(self, ctx, *, query):
-        async with self.session.get(
-            f"{WolframAlpha.RESULT_API_URL}?appid={self.app_id}&i={query}"
-        ) as response:
-            if response.status != 200:
-                await ctx.send(WolframAlpha.MSG_REQUEST_FAILED)
-            else:
-                content = await response.text()
-                if content is not None:
-                    await ctx.send(content)
-                else:
-                    await ctx.send(WolframAlpha.MSG_EMPTY_RESPONSE)
+        content = await self.get_result(normalize_query(query), query)
+
+        if content is None:
+            await ctx.send(WolframAlpha.MSG_REQUEST_FAILED)
+        elif content:
+            await ctx.send(content)
+        else:
+            await ctx.send(WolframAlpha.MSG_EMPTY_RESPONSE)
 
     @wolfram_alpha.command(aliases=["i"])
     async def image(self, ctx, *, query):
-        async with self.session.get(
-            f"{WolframAlpha.SIMPLE_API_URL}?appid={self.app_id}&i={query}"
-        ) as response:
-            if response.status != 200:
-                await ctx.send(WolframAlpha.MSG_REQUEST_FAILED)
-            else:
-                content = await response.read()
-                if content is not None:
-                    file = File(BytesIO(content), filename="wolfram.gif")
-                    await ctx.send(file=file)
-                else:
-                    await ctx.send(WolframAlpha.MSG_EMPTY_RESPONSE)
+        image = await self.get_image(query)
+
+        if image is None:
+            await ctx.send(WolframAlpha.MSG_REQUEST_FAILED)
+        elif image.size:
+            await ctx.send(file=image.to_file())
+        else:
+            await ctx.send(WolframAlpha.MSG_EMPTY_RESPONSE)
 
     async def cog_before_invoke(self, ctx):
         await ctx.typing()
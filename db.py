@@ -1,7 +1,21 @@
+import re
 import typing
+from collections import Counter
 
 import pendulum
-from sqlalchemy import select, delete, func, desc
+from sqlalchemy import (
+    select,
+    delete,
+    insert,
+    func,
+    update,
+    values,
+    column,
+    Integer,
+    table,
+    text,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models import (
@@ -17,9 +31,11 @@ from models import (
     GuildSettings,
     EmojiSettings,
     Tag,
+    TagRecord,
     Reminder,
     ChannelMirror,
     CommandLog,
+    CommandUsageRollup,
     TwtSetting,
     TwtAccount,
     TwtSorting,
@@ -30,6 +46,8 @@ from models import (
     CustomRoleSettings,
     BlockedUser,
     BannedWord,
+    WeatherLocation,
+    ShortUrl,
 )
 
 
@@ -47,6 +65,37 @@ async def get_tags(session):
     return [r for (r,) in result]
 
 
+async def get_tag_records(session, guild_id=None) -> list[TagRecord]:
+    """
+    Loads tags as TagRecords. Only the columns are selected, so no ORM instances are created.
+    """
+    statement = select(*TagRecord.columns())
+    if guild_id:
+        statement = statement.where(Tag._guild == guild_id)
+
+    result = (await session.execute(statement)).all()
+
+    return [TagRecord(*row) for row in result]
+
+
+async def increment_tag_use_counts(session, deltas: dict[int, int]) -> None:
+    """
+    Adds the given deltas to the use counts of the respective tags with a single
+    UPDATE ... FROM (VALUES ...) statement. The increment happens in the database, so concurrent
+    writers cannot overwrite each other's counts.
+    """
+    deltas_table = values(
+        column("tag_id", Integer), column("delta", Integer), name="deltas"
+    ).data(list(deltas.items()))
+
+    statement = (
+        update(Tag)
+        .where(Tag.tag_id == deltas_table.c.tag_id)
+        .values(use_count=func.coalesce(Tag.use_count, 0) + deltas_table.c.delta)
+    )
+    await session.execute(statement)
+
+
 async def get_reminders(session, user_id=None):
     if user_id:
         statement = select(Reminder).where(
@@ -117,6 +166,10 @@ async def get_twitter_settings(
         )
         result = (await session.execute(statement)).all()
         return [r for (r,) in result]
+    elif not (guild_list or disabled_servers):
+        statement = select(TwtSetting)
+        result = (await session.execute(statement)).all()
+        return [r for (r,) in result]
     else:
         raise TypeError("Passed an invalid combination of kwargs")
 
@@ -158,6 +211,8 @@ async def get_twitter_sorting(
         statement = select(TwtSorting).where(
             TwtSorting._guild.in_(guild_list) & TwtSorting.hashtag.in_(tag_list)
         )
+    elif not (hashtag or tag_list or guild_list):
+        statement = select(TwtSorting)
     else:
         raise TypeError("Passed an invalid combination of kwargs")
 
@@ -179,6 +234,8 @@ async def get_twitter_filters(
         )
     elif guild_id:
         statement = select(TwtFilter).where(TwtFilter._guild == guild_id)
+    elif not (filter_ or guild_list or word_list):
+        statement = select(TwtFilter)
     else:
         raise TypeError("Passed an invalid combination of kwargs")
 
@@ -294,13 +351,27 @@ async def delete_idols(session):
     await session.execute(statement)
 
 
-async def delete_banned_words(session: AsyncSession) -> None:
-    statement = delete(BannedWord)
-    await session.execute(statement)
+async def delete_banned_words(
+    session: AsyncSession, words: typing.Optional[list[str]] = None
+) -> list[str]:
+    """
+    Deletes the given banned words, or all of them if words is None, and returns the deleted words.
+    """
+    statement = delete(BannedWord).returning(BannedWord.word)
+    if words is not None:
+        statement = statement.where(BannedWord.word.in_(words))
+
+    result = await session.execute(statement)
+    return [r for (r,) in result]
 
 
-async def get_banned_words(session: AsyncSession) -> list[BannedWord]:
+async def get_banned_words(
+    session: AsyncSession, words: typing.Optional[list[str]] = None
+) -> list[BannedWord]:
     statement = select(BannedWord)
+    if words is not None:
+        statement = statement.where(BannedWord.word.in_(words))
+
     result = (await session.execute(statement)).all()
 
     return [r for (r,) in result]
@@ -461,20 +532,180 @@ async def delete_greeter(session, guild_id, greeter_type):
     return (await session.execute(statement)).first()
 
 
+async def insert_command_logs(session, rows: list[dict]) -> None:
+    """Inserts the given command logs with a single multi-row INSERT."""
+    statement = insert(CommandLog).values(rows)
+    await session.execute(statement)
+
+
+COMMAND_LOG_PARTITION_REGEX = re.compile(r"command_logs_y(\d{4})m(\d{2})")
+COMMAND_LOG_DEFAULT_PARTITION = table(
+    "command_logs_default", *[column(c.name) for c in CommandLog.__table__.columns]
+)
+
+
+def command_log_partition_name(month: pendulum.DateTime) -> str:
+    return f"command_logs_y{month.year}m{month.month:02d}"
+
+
+async def get_command_log_partitions(session) -> dict[str, pendulum.DateTime]:
+    """Returns the monthly partitions of command_logs by name and the month they hold."""
+    statement = text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'command_logs'"
+    )
+    result = (await session.execute(statement)).all()
+
+    partitions = {}
+    for (name,) in result:
+        if match := COMMAND_LOG_PARTITION_REGEX.fullmatch(name):
+            partitions[name] = pendulum.datetime(int(match[1]), int(match[2]), 1)
+
+    return partitions
+
+
+async def create_command_log_partitions(session, months_ahead: int) -> list[str]:
+    """
+    Makes sure there is a partition for the current month and the given number of months after
+    it. Returns the names of the partitions that were created.
+    """
+    existing = await get_command_log_partitions(session)
+    month = pendulum.now("UTC").start_of("month")
+    created = []
+
+    for _ in range(months_ahead + 1):
+        name = command_log_partition_name(month)
+        end = month.add(months=1)
+
+        if name not in existing:
+            # the range can only be attached once no row of it is left in the default partition
+            default = COMMAND_LOG_DEFAULT_PARTITION
+            statement = (
+                delete(default)
+                .where((default.c.date >= month) & (default.c.date < end))
+                .returning(*default.c)
+            )
+            moved = (await session.execute(statement)).all()
+
+            await session.execute(
+                text(
+                    f'CREATE TABLE "{name}" PARTITION OF command_logs '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+                )
+            )
+
+            if moved:
+                await insert_command_logs(
+                    session, [dict(row._mapping) for row in moved]
+                )
+
+            created.append(name)
+
+        month = end
+
+    return created
+
+
+async def drop_command_log_partitions(
+    session, before: pendulum.DateTime, archive: bool = False
+) -> list[str]:
+    """
+    Drops the monthly partitions that only hold logs from before the given date. If archive is
+    set, they are detached and kept as standalone tables instead. Returns their names.
+    """
+    removed = []
+
+    for name, month in sorted(
+        (await get_command_log_partitions(session)).items(), key=lambda item: item[1]
+    ):
+        if month.add(months=1) > before:
+            break
+
+        if archive:
+            await session.execute(
+                text(f'ALTER TABLE command_logs DETACH PARTITION "{name}"')
+            )
+        else:
+            await session.execute(text(f'DROP TABLE "{name}"'))
+
+        removed.append(name)
+
+    return removed
+
+
+async def upsert_command_usage_rollups(session, rows: list[dict]) -> None:
+    """
+    Adds the given command logs to the hourly usage rollups of their users and guilds.
+    """
+    counts = Counter()
+    for row in rows:
+        bucket = row["date"].start_of("hour")
+        counts[(row["command_name"], "user", row["_user"], bucket)] += 1
+
+        if row["_guild"] is not None:
+            counts[(row["command_name"], "guild", row["_guild"], bucket)] += 1
+
+    statement = pg_insert(CommandUsageRollup).values(
+        [
+            {
+                "command_name": command_name,
+                "scope": scope,
+                "_target": target,
+                "bucket": bucket,
+                "count": count,
+            }
+            for (command_name, scope, target, bucket), count in counts.items()
+        ]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["command_name", "scope", "_target", "bucket"],
+        set_={"count": CommandUsageRollup.count + statement.excluded["count"]},
+    )
+    await session.execute(statement)
+
+
 async def get_command_usage_by(session, by, command_name, weeks):
-    by_ = CommandLog._user if by == "user" else CommandLog._guild
-    statement = (
-        select(by_, CommandLog.command_name, func.count(CommandLog._command_log))
+    """
+    Returns (user or guild ID, command name, count) tuples ordered by count. Whole hours are read
+    from the usage rollups, only the partial hour at the start of the window from the raw logs.
+    Any other by than "user" counts by guild, commands used in DMs are not counted then.
+    """
+    scope = "user" if by == "user" else "guild"
+    start = pendulum.now("UTC").subtract(weeks=weeks)
+    boundary = start.start_of("hour")
+    if boundary < start:
+        boundary = boundary.add(hours=1)
+
+    rolled_up = (
+        select(CommandUsageRollup._target, func.sum(CommandUsageRollup.count))
+        .where(
+            (CommandUsageRollup.command_name == command_name)
+            & (CommandUsageRollup.scope == scope)
+            & (CommandUsageRollup.bucket >= boundary)
+        )
+        .group_by(CommandUsageRollup._target)
+    )
+
+    by_ = CommandLog._user if scope == "user" else CommandLog._guild
+    tail = (
+        select(by_, func.count(CommandLog._command_log))
         .where(
             (CommandLog.command_name == command_name)
-            & (CommandLog.date >= pendulum.now("UTC").subtract(weeks=weeks))
+            & (CommandLog.date >= start)
+            & (CommandLog.date < boundary)
+            & (by_ != None)  # noqa
         )
-        .group_by(by_, CommandLog.command_name)
-        .order_by(desc(func.count(CommandLog._command_log)))
+        .group_by(by_)
     )
-    result = (await session.execute(statement)).all()
 
-    return result
+    counts = Counter()
+    for statement in (rolled_up, tail):
+        for target, count in (await session.execute(statement)).all():
+            counts[target] += count
+
+    return [(target, command_name, count) for target, count in counts.most_common()]
 
 
 async def get_cog_guilds(session, cog_name: str):
@@ -482,3 +713,48 @@ async def get_cog_guilds(session, cog_name: str):
     result = (await session.execute(statement)).all()
 
     return [r for (r,) in result]
+
+
+async def get_weather_location(session, query: str) -> typing.Optional[WeatherLocation]:
+    statement = select(WeatherLocation).where(WeatherLocation.query == query)
+    result = (await session.execute(statement)).first()
+
+    return result[0] if result else None
+
+
+async def add_weather_location(session, **values) -> None:
+    """Stores a geocoded location, unless the same query was stored in the meantime."""
+    statement = (
+        pg_insert(WeatherLocation)
+        .values(date=pendulum.now("UTC"), **values)
+        .on_conflict_do_nothing(index_elements=["query"])
+    )
+    await session.execute(statement)
+
+
+async def get_short_urls(session, domain: str, long_urls) -> dict[str, str]:
+    statement = select(ShortUrl.long_url, ShortUrl.link).where(
+        ShortUrl.domain == domain, ShortUrl.long_url.in_(long_urls)
+    )
+    result = (await session.execute(statement)).all()
+
+    return {long_url: link for long_url, link in result}
+
+
+async def add_short_urls(session, domain: str, links: dict[str, str]) -> None:
+    statement = (
+        pg_insert(ShortUrl)
+        .values(
+            [
+                {
+                    "long_url": long_url,
+                    "domain": domain,
+                    "link": link,
+                    "date": pendulum.now("UTC"),
+                }
+                for long_url, link in links.items()
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["long_url", "domain"])
+    )
+    await session.execute(statement)
@@ -5,12 +5,14 @@ from .channel_mirror import ChannelMirror
 from .custom_role import CustomRole, CustomRoleSettings
 from .greeter import Greeter, GreeterType
 from .guild_settings import GuildSettings, EmojiSettings, GuildCog
-from .log import CommandLog
+from .log import CommandLog, CommandUsageRollup
 from .profile import Profile
 from .reminder import Reminder
 from .role import RoleAlias, RoleClear, AssignableRole, RoleSettings
-from .tag import Tag
+from .tag import Tag, TagRecord
 from .twitter import TwtSetting, TwtAccount, TwtSorting, TwtFilter
+from .url_shortener import ShortUrl
+from .weather import WeatherLocation
 
 __all__ = (
     "BannedWord",
@@ -28,6 +30,7 @@ __all__ = (
     "Profile",
     "Reminder",
     "Tag",
+    "TagRecord",
     "RoleAlias",
     "RoleClear",
     "AssignableRole",
@@ -36,8 +39,11 @@ __all__ = (
     "GreeterType",
     "BotwSettings",
     "CommandLog",
+    "CommandUsageRollup",
     "TwtSetting",
     "TwtAccount",
     "TwtSorting",
     "TwtFilter",
+    "ShortUrl",
+    "WeatherLocation",
 )
@@ -1,18 +1,36 @@
-from sqlalchemy import Column, BigInteger, String, Integer, Text
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    String,
+    Integer,
+    Text,
+    Index,
+    DDL,
+    event,
+)
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from models.base import Base, PendulumDateTime
 
 
 class CommandLog(Base):
+    """
+    Range partitioned by month on date, see db.create_command_log_partitions. The partition key
+    has to be part of the primary key.
+    """
+
     __tablename__ = "command_logs"
+    __table_args__ = (
+        Index("ix_command_logs_command_name_date", "command_name", "date"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
-    _command_log = Column(Integer, primary_key=True)
+    _command_log = Column(Integer, primary_key=True, autoincrement=True)
     command_name = Column(String, nullable=False)
     cog = Column(String, nullable=False)
     _user = Column(BigInteger, nullable=False)
     _guild = Column(BigInteger, nullable=True)
-    date = Column(PendulumDateTime, default=PendulumDateTime.now())
+    date = Column(PendulumDateTime, primary_key=True, default=PendulumDateTime.now())
     args = Column(Text)
 
     @hybrid_property
@@ -26,3 +44,28 @@ class CommandLog(Base):
     @classmethod
     def inject_bot(cls, bot):
         cls.bot = bot
+
+
+# catches rows outside of the monthly partitions, so inserts never fail
+event.listen(
+    CommandLog.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS command_logs_default PARTITION OF command_logs DEFAULT"
+    ),
+)
+
+
+class CommandUsageRollup(Base):
+    """
+    Hourly usage counts of a command per user (scope "user") or guild (scope "guild"). Maintained
+    by the command log writer alongside the raw command logs.
+    """
+
+    __tablename__ = "command_usage_rollups"
+
+    command_name = Column(String, primary_key=True)
+    scope = Column(String, primary_key=True)
+    _target = Column(BigInteger, primary_key=True)
+    bucket = Column(PendulumDateTime, primary_key=True)
+    count = Column(Integer, nullable=False)
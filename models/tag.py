@@ -18,35 +18,13 @@ from util import safe_mention
 IMAGE_URL_REGEX = r"https?:\/\/.*\.(jpe?g|png|gif)$"
 
 
-class Tag(Base):
-    __tablename__ = "tags"
-    EDITABLE = frozenset(["trigger", "reaction", "in_msg"])
-
-    tag_id = Column(Integer, primary_key=True)
-    trigger = Column(String, nullable=False)
-    reaction = Column(String, nullable=False)
-    in_msg = Column(Boolean, default=False)
-    _creator = Column(BigInteger, nullable=False)
-    _guild = Column(BigInteger, nullable=False)
-    use_count = Column(Integer, default=0)
-    date = Column(PendulumDateTime, default=PendulumDateTime.now())
+class TagMixin:
+    """Behavior shared by the Tag model and its detached TagRecord counterpart."""
 
-    @hybrid_property
-    def creator(self):
-        return self.bot.get_user(self._creator)
+    __slots__ = ()
 
-    @hybrid_property
-    def guild(self):
-        return self.bot.get_guild(self._guild)
-
-    def __eq__(self, other):
-        if not isinstance(other, Tag):
-            return NotImplemented
-        return (
-            str.lower(self.trigger) == str.lower(other.trigger)
-            and str.lower(self.reaction) == str.lower(other.reaction)
-            and self._guild == other._guild
-        )
+    def normalized_key(self) -> tuple[str, str]:
+        return normalize_tag_key(self.trigger, self.reaction)
 
     def to_list_element(self, index):
         return f"*{index + 1}*. `{self.tag_id}`: *{self.trigger}* by {self.creator}"
@@ -67,15 +45,6 @@ class Tag(Base):
 
         return embed
 
-    async def increment_use_count(self, session):
-        self.use_count += 1
-        statement = (
-            update(Tag)
-            .where(Tag.tag_id == self.tag_id)
-            .values(use_count=self.use_count)
-        )
-        await session.execute(statement)
-
     async def delete(self, session):
         statement = delete(Tag).where(Tag.tag_id == self.tag_id)
         await session.execute(statement)
@@ -88,3 +57,86 @@ class Tag(Base):
     @classmethod
     def inject_bot(cls, bot):
         cls.bot = bot
+
+
+def normalize_tag_key(trigger: str, reaction: str) -> tuple[str, str]:
+    return trigger.lower(), reaction.lower()
+
+
+class Tag(TagMixin, Base):
+    __tablename__ = "tags"
+    EDITABLE = frozenset(["trigger", "reaction", "in_msg"])
+
+    tag_id = Column(Integer, primary_key=True)
+    trigger = Column(String, nullable=False)
+    reaction = Column(String, nullable=False)
+    in_msg = Column(Boolean, default=False)
+    _creator = Column(BigInteger, nullable=False)
+    _guild = Column(BigInteger, nullable=False)
+    use_count = Column(Integer, default=0)
+    date = Column(PendulumDateTime, default=PendulumDateTime.now())
+
+    @hybrid_property
+    def creator(self):
+        return self.bot.get_user(self._creator)
+
+    @hybrid_property
+    def guild(self):
+        return self.bot.get_guild(self._guild)
+
+    def __eq__(self, other):
+        if not isinstance(other, Tag):
+            return NotImplemented
+        return (
+            self.normalized_key() == other.normalized_key()
+            and self._guild == other._guild
+        )
+
+
+class TagRecord(TagMixin):
+    """
+    A plain, slotted copy of a Tag row that is not tracked by any session. Used for the
+    in-memory tag cache, where a full ORM instance per tag costs several times the memory.
+    """
+
+    __slots__ = (
+        "tag_id",
+        "trigger",
+        "reaction",
+        "in_msg",
+        "_creator",
+        "_guild",
+        "use_count",
+        "date",
+    )
+
+    def __init__(
+        self, tag_id, trigger, reaction, in_msg, _creator, _guild, use_count, date
+    ):
+        self.tag_id = tag_id
+        self.trigger = trigger
+        self.reaction = reaction
+        self.in_msg = bool(in_msg)
+        self._creator = _creator
+        self._guild = _guild
+        self.use_count = use_count or 0
+        self.date = date
+
+    @classmethod
+    def columns(cls):
+        return [getattr(Tag, slot) for slot in cls.__slots__]
+
+    @classmethod
+    def from_model(cls, tag: Tag) -> "TagRecord":
+        return cls(*[getattr(tag, slot) for slot in cls.__slots__])
+
+    @property
+    def creator(self):
+        return self.bot.get_user(self._creator)
+
+    @property
+    def guild(self):
+        return self.bot.get_guild(self._guild)
+
+    def __repr__(self):
+        return f"<TagRecord=(tag_id={self.tag_id},trigger={self.trigger},_guild={self._guild})>"
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String
+
+from models.base import Base, PendulumDateTime
+
+
+class ShortUrl(Base):
+    __tablename__ = "short_urls"
+
+    long_url = Column(String, primary_key=True)
+    domain = Column(String, primary_key=True)
+    link = Column(String, nullable=False)
+    date = Column(PendulumDateTime, default=PendulumDateTime.now())
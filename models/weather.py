@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Float
+
+from models.base import Base, PendulumDateTime
+
+
+class WeatherLocation(Base):
+    """Coordinates of a location that was geocoded with OpenWeatherMap, by normalized query."""
+
+    __tablename__ = "weather_locations"
+
+    query = Column(String, primary_key=True)
+    city_id = Column(Integer, nullable=False)
+    city = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    date = Column(PendulumDateTime, default=PendulumDateTime.now())
@@ -1,4 +1,7 @@
+from .aho_corasick import AhoCorasick
+from .batch_writer import BatchWriter
 from .channel_locker import ChannelLocker
+from .delay_queue import DelayQueue
 from .cogs import PrivilegedCogNoPermissions, PrivilegedCog
 from .converters import (
     BoolConverter,
@@ -7,13 +10,21 @@ from .converters import (
 )
 from .decorators import auto_help, ack, Cached, LeastRecentlyUsed
 from .dnf_parser import DNFParser
-from .fuzzy import ratio
+from .downloader import SizeCappedDownloader, DownloadResult
+from .fuzzy import ratio, NGramIndex
+from .http_pool import HttpPool
+from .media import MediaBuffer, pack_attachments
+from .media_cache import MediaCache, normalize_media_url
+from .request_batcher import RequestBatcher
+from .single_flight import SingleFlight
 from .retrying_context_manager import (
     RetryingSession,
     ExceededMaximumRetries,
     ReactingRetryingSession,
+    CircuitOpenError,
+    host_stats,
 )
-from .trie import TrieNode
+from .trie import BannedWordsAutomaton
 from .util import (
     chunker,
     ordered_sublists,
@@ -25,6 +36,7 @@ from .util import (
     meters_to_miles,
     Cooldown,
     flatten,
+    deep_getsizeof,
     git_short_history,
     git_version_label,
     draw_rotated_text,
@@ -43,6 +55,7 @@ __all__ = (
     "ack",
     "DNFParser",
     "ratio",
+    "NGramIndex",
     "chunker",
     "ordered_sublists",
     "random_bool",
@@ -53,6 +66,7 @@ __all__ = (
     "meters_to_miles",
     "Cooldown",
     "flatten",
+    "deep_getsizeof",
     "git_version_label",
     "git_short_history",
     "draw_rotated_text",
@@ -64,12 +78,26 @@ __all__ = (
     "RetryingSession",
     "ExceededMaximumRetries",
     "ReactingRetryingSession",
+    "CircuitOpenError",
+    "host_stats",
     "Cached",
     "LeastRecentlyUsed",
     "ChannelLocker",
     "cmd_to_str",
     "PrivilegedCogNoPermissions",
     "PrivilegedCog",
-    "TrieNode",
+    "BannedWordsAutomaton",
+    "AhoCorasick",
+    "BatchWriter",
+    "RequestBatcher",
+    "SingleFlight",
+    "DelayQueue",
+    "MediaBuffer",
+    "pack_attachments",
+    "MediaCache",
+    "HttpPool",
+    "normalize_media_url",
+    "SizeCappedDownloader",
+    "DownloadResult",
     "format_template",
 )
@@ -0,0 +1,135 @@
+import typing
+from collections import deque
+
+Symbol = typing.Hashable
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher over sequences of hashable symbols (characters, words, ...).
+
+    Patterns can be added and removed at any time. Adding a pattern only extends the trie,
+    failure links are recomputed lazily before the next search. Removing a pattern only drops
+    its payload, so it never invalidates the links.
+    """
+
+    ROOT = 0
+
+    def __init__(self):
+        # per-node state is kept in parallel lists to stay compact
+        self._goto: list[dict[Symbol, int]] = [{}]
+        self._fail: list[int] = [self.ROOT]
+        # payloads of patterns ending at the node
+        self._outputs: list[typing.Optional[set]] = [None]
+        # nearest node along the failure chain that is the end of a pattern
+        self._output_link: list[typing.Optional[int]] = [None]
+        self._compiled = True
+        self._patterns = 0
+
+    def __len__(self):
+        return self._patterns
+
+    def add(self, pattern: typing.Sequence[Symbol], payload: typing.Hashable) -> None:
+        if len(pattern) == 0:
+            return
+
+        node = self.ROOT
+        for symbol in pattern:
+            child = self._goto[node].get(symbol)
+
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(self.ROOT)
+                self._outputs.append(None)
+                self._output_link.append(None)
+                self._goto[node][symbol] = child
+                self._compiled = False
+
+            node = child
+
+        if self._outputs[node] is None:
+            self._outputs[node] = set()
+            self._compiled = False
+
+        if payload not in self._outputs[node]:
+            self._outputs[node].add(payload)
+            self._patterns += 1
+
+    def discard(
+        self, pattern: typing.Sequence[Symbol], payload: typing.Hashable
+    ) -> None:
+        node = self._find(pattern)
+
+        if node is not None and payload in (self._outputs[node] or ()):
+            self._outputs[node].remove(payload)
+            self._patterns -= 1
+
+    def _find(self, pattern: typing.Sequence[Symbol]) -> typing.Optional[int]:
+        node = self.ROOT
+        for symbol in pattern:
+            node = self._goto[node].get(symbol)
+            if node is None:
+                return None
+
+        return node
+
+    def compile(self) -> None:
+        """Computes the failure and output links with a breadth-first pass over the trie."""
+        queue = deque()
+
+        for child in self._goto[self.ROOT].values():
+            self._fail[child] = self.ROOT
+            self._output_link[child] = None
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+
+            for symbol, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail != self.ROOT and symbol not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                fail = self._goto[fail].get(symbol, self.ROOT)
+                self._fail[child] = fail
+                self._output_link[child] = (
+                    fail if self._outputs[fail] is not None else self._output_link[fail]
+                )
+                queue.append(child)
+
+        self._compiled = True
+
+    def iter_matches(
+        self, sequence: typing.Iterable[Symbol]
+    ) -> typing.Iterator[tuple[int, typing.Hashable]]:
+        """
+        Yields (end_index, payload) for every occurrence of every pattern in a single pass.
+        """
+        if not self._compiled:
+            self.compile()
+
+        goto, fail, outputs, output_link = (
+            self._goto,
+            self._fail,
+            self._outputs,
+            self._output_link,
+        )
+        node = self.ROOT
+
+        for index, symbol in enumerate(sequence):
+            while node != self.ROOT and symbol not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(symbol, self.ROOT)
+
+            match = node if outputs[node] is not None else output_link[node]
+            while match is not None:
+                yield from ((index, payload) for payload in outputs[match])
+                match = output_link[match]
+
+    def matches(self, sequence: typing.Iterable[Symbol]) -> set:
+        """Returns the payloads of all patterns that occur in the sequence."""
+        return {payload for _, payload in self.iter_matches(sequence)}
+
+    def contains_match(self, sequence: typing.Iterable[Symbol]) -> bool:
+        return next(self.iter_matches(sequence), None) is not None
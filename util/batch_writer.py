@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    Buffers items in a bounded queue that a background task drains in batches. A batch is written
+    once max_batch_size items are pending or flush_interval seconds after its first item arrived,
+    whichever comes first. If the queue is full, new items are dropped and counted instead of
+    blocking the caller. A batch that fails to be written is retried with exponential backoff
+    before it is given up on.
+    """
+
+    RETRY_DELAY_BASE = 2
+
+    def __init__(
+        self,
+        write: typing.Callable[[list], typing.Awaitable[None]],
+        max_size: int = 10_000,
+        max_batch_size: int = 500,
+        flush_interval: float = 5.0,
+        name: str = "batch writer",
+        max_tries: int = 3,
+    ):
+        self._write = write
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._batch_ready = asyncio.Event()
+        self._task = None
+        self._closed = False
+        self._overflowing = False
+
+        self.max_size = max_size
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.name = name
+        self.max_tries = max_tries
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_write_duration = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, item) -> bool:
+        """Enqueues an item without waiting. Returns False if it was dropped."""
+        if self._closed:
+            self.dropped += 1
+            return False
+
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if not self._overflowing:
+                logger.warning("%s is full, dropping items", self.name)
+                self._overflowing = True
+            return False
+
+        self._overflowing = False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+        if self.depth >= self.max_batch_size:
+            self._batch_ready.set()
+
+        return True
+
+    async def stop(self) -> None:
+        """Writes everything that was enqueued so far and stops the background task."""
+        if self._closed:
+            return
+
+        self._closed = True
+
+        if self._task is None:
+            return
+
+        await self._queue.put(_STOP)
+        self._batch_ready.set()
+        await self._task
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "capacity": self.max_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "last_write_ms": round(self.last_write_duration * 1000, 2),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+
+            # once stopping, drain the remaining items without waiting
+            if not self._closed:
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), timeout=self.flush_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+            self._batch_ready.clear()
+
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+
+            if batch:
+                await self._write_batch(batch)
+
+            if stop:
+                return
+            elif self.depth >= self.max_batch_size:
+                self._batch_ready.set()
+
+    async def _write_batch(self, batch: list) -> None:
+        for current_try in range(self.max_tries):
+            start = time.perf_counter()
+
+            try:
+                await self._write(batch)
+            except Exception:
+                if current_try == self.max_tries - 1:
+                    self.failed += len(batch)
+                    logger.exception(
+                        "%s could not write %d items after %d tries, they are lost",
+                        self.name,
+                        len(batch),
+                        self.max_tries,
+                    )
+                    return
+
+                delay = self.RETRY_DELAY_BASE**current_try
+                self.retries += 1
+                logger.warning(
+                    "%s could not write %d items, retrying in %d seconds",
+                    self.name,
+                    len(batch),
+                    delay,
+                    exc_info=True,
+                )
+                await asyncio.sleep(delay)
+            else:
+                self.written += len(batch)
+                self.batches += 1
+                return
+            finally:
+                self.last_write_duration = time.perf_counter() - start
@@ -1,12 +1,15 @@
 import asyncio
 import json
+import time
+import typing
 from collections import OrderedDict
 from functools import wraps
 
-import aiohttp
 from discord.ext import commands
 
 from const import UNICODE_EMOJI
+from util.single_flight import SingleFlight
+from util.util import deep_getsizeof
 
 
 async def _call_help(ctx):
@@ -49,58 +52,192 @@ class LeastRecentlyUsed(OrderedDict):
             del self[oldest_key]
 
 
+class _CacheEntry(typing.NamedTuple):
+    value: typing.Any
+    expires: float
+    size: int
+
+
 class Cached:
-    def __init__(self, size: int = 64, ignored_args: list[str] = None):
-        self._cache = LeastRecentlyUsed(size)
-        self._ignored = ignored_args or []
+    """
+    Memoizes an async function in an LRU cache.
+
+    - ttl: seconds an entry stays valid, None keeps it until it is evicted
+    - negative_ttl: seconds a None result is cached for, None does not cache them at all
+    - size: number of entries, 0 keeps none and only shares concurrent calls
+    - max_bytes: evicts entries until their approximate size (see deep_getsizeof) fits
+    - ignored_args: names of keyword arguments and indices (as strings) of positional arguments
+      that are not part of the key
+
+    Concurrent calls with the same key share a single call of the function. Keys are built from
+    the arguments directly if they are hashable, and from their JSON serialization otherwise.
+    """
+
+    def __init__(
+        self,
+        size: int = 64,
+        ignored_args: list[str] = None,
+        ttl: typing.Optional[float] = None,
+        negative_ttl: typing.Optional[float] = None,
+        max_bytes: typing.Optional[int] = None,
+    ):
+        self._cache: OrderedDict[typing.Hashable, _CacheEntry] = OrderedDict()
+        self._in_flight = SingleFlight()
+        self._ignored = set(ignored_args or [])
+
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
 
     def __call__(self, func):
         @wraps(func)
         async def cached_func(*args, **kwargs):
-            combined = kwargs.copy()
-
-            for idx, arg in enumerate(args):
-                combined[str(idx)] = arg
+            key = self.make_key(args, kwargs)
 
-            for ignored_arg in self._ignored:
-                try:
-                    combined.pop(ignored_arg)
-                except KeyError:
-                    pass
+            if (entry := self._cache.get(key)) is not None:
+                if entry.expires > time.monotonic():
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
 
-            combined_str = json.dumps(combined, sort_keys=True)
+                self.expirations += 1
+                self._remove(key)
 
-            if cached := self._cache.get(combined_str):
-                print(cached)
-                return cached
+            if key in self._in_flight:
+                self.coalesced += 1
             else:
-                res = await func(*args, **kwargs)
-                self._cache[combined_str] = res
-                return res
+                self.misses += 1
 
+            return await self._in_flight.run(key, self._call, key, func, args, kwargs)
+
+        cached_func.cache = self
+        cached_func.invalidate = lambda *args, **kwargs: self.invalidate(
+            self.make_key(args, kwargs)
+        )
         return cached_func
 
+    def make_key(self, args, kwargs) -> typing.Hashable:
+        positional = tuple(
+            arg for index, arg in enumerate(args) if str(index) not in self._ignored
+        )
+        named = tuple(
+            sorted(item for item in kwargs.items() if item[0] not in self._ignored)
+        )
+        key = (positional, named)
 
-async def _test():
-    session = aiohttp.ClientSession()
+        try:
+            hash(key)
+            return key
+        except TypeError:
+            return json.dumps([positional, named], sort_keys=True)
 
-    @Cached(3, ["b"])
-    async def make_request(url, **kwargs):
-        print("making request to " + url)
-        async with session.get(url) as response:
-            data = await response.read()
+    async def _call(self, key, func, args, kwargs):
+        value = await func(*args, **kwargs)
+
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if value is not None or self.negative_ttl is not None:
+            self._store(key, value, ttl)
+
+        return value
+
+    def _store(self, key, value, ttl: typing.Optional[float]) -> None:
+        if self.size == 0:
+            return
+
+        expires = time.monotonic() + ttl if ttl is not None else float("inf")
+        size = deep_getsizeof(value) if self.max_bytes is not None else 0
 
-        return data
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
 
-    await make_request("http://google.com")
-    await make_request("http://google.com", a=1, b=1)
-    await make_request("http://google.com", a=1, b=2)
-    await make_request("http://google.com", a=2, b=3)
-    await make_request("http://google.com", a=3, b=4)
-    await make_request("http://google.com", a=4, b=5)
-    await make_request("http://google.com", a=5, b=6)
+        if key in self._cache:
+            self._remove(key)
 
-    await session.close()
+        self._cache[key] = _CacheEntry(value, expires, size)
+        self.bytes += size
+
+        while len(self._cache) > self.size or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._cache)))
+            self.evictions += 1
+
+    def _remove(self, key) -> None:
+        self.bytes -= self._cache.pop(key).size
+
+    def invalidate(self, key=None) -> None:
+        """Drops the entry of the given key, or all entries if no key is given."""
+        if key is None:
+            self._cache.clear()
+            self.bytes = 0
+        elif key in self._cache:
+            self._remove(key)
+
+    def stats(self) -> dict[str, typing.Any]:
+        lookups = self.hits + self.misses + self.coalesced
+
+        return {
+            "entries": len(self._cache),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": f"{(self.hits + self.coalesced) / lookups:.1%}"
+            if lookups
+            else "-",
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+async def _test():
+    calls = []
+
+    @Cached(3, ["b"], ttl=0.2, negative_ttl=0.1)
+    async def make_request(url, **kwargs):
+        calls.append((url, kwargs))
+        await asyncio.sleep(0.05)
+        return None if url == "missing" else url * 2
+
+    # concurrent misses for the same key share one call, b is not part of the key
+    results = await asyncio.gather(
+        *[make_request("a", a=1, b=b) for b in range(10)], make_request("missing")
+    )
+    assert results == ["aa"] * 10 + [None] and len(calls) == 2, calls
+
+    await make_request("missing")
+    await make_request("a", a=1)
+    assert len(calls) == 2
+
+    await asyncio.sleep(0.1)  # the None result expired
+    await make_request("missing")
+    assert len(calls) == 3
+
+    # unhashable arguments are serialized
+    await make_request("c", a=[1, 2])
+    await make_request("c", a=[1, 2])
+    assert len(calls) == 4
+
+    # size 0 only shares concurrent calls
+    @Cached(0)
+    async def fetch(url):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        return url
+
+    await asyncio.gather(fetch("d"), fetch("d"))
+    await fetch("d")
+    assert calls[4:] == ["d", "d"] and not fetch.cache.stats()["entries"], calls
+
+    print(make_request.cache.stats())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+
+class DelayQueue:
+    """
+    Bounded queue of items that are each processed delay seconds after they were put, by a pool
+    of worker tasks. Putting never blocks, if the queue is full the item is dropped and counted.
+    Since every item has the same delay, items become due in the order they were put.
+    """
+
+    def __init__(
+        self,
+        process: typing.Callable[[typing.Any], typing.Awaitable[None]],
+        delay: float,
+        workers: int = 4,
+        max_size: int = 1000,
+        name: str = "delay queue",
+    ):
+        self._process = process
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._workers: list[asyncio.Task] = []
+
+        self.delay = delay
+        self.worker_count = workers
+        self.max_size = max_size
+        self.name = name
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.busy = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work()) for _ in range(self.worker_count)
+            ]
+
+    def stop(self) -> None:
+        """Cancels the workers, items that are still queued are discarded."""
+        for worker in self._workers:
+            worker.cancel()
+
+        self._workers = []
+
+    def put(self, item) -> bool:
+        """Enqueues an item without waiting. Returns False if it was dropped."""
+        due = asyncio.get_running_loop().time() + self.delay
+
+        try:
+            self._queue.put_nowait((due, item))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("%s is full, dropping %s", self.name, item)
+            return False
+
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return True
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "capacity": self.max_size,
+            "busy_workers": f"{self.busy}/{self.worker_count}",
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "last_lag_s": round(self.last_lag, 2),
+            "max_lag_s": round(self.max_lag, 2),
+        }
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            due, item = await self._queue.get()
+
+            try:
+                if (wait := due - loop.time()) > 0:
+                    await asyncio.sleep(wait)
+
+                # how long the item waited for a free worker after it was due
+                self.last_lag = max(loop.time() - due, 0.0)
+                self.max_lag = max(self.max_lag, self.last_lag)
+
+                self.busy += 1
+                try:
+                    await self._process(item)
+                finally:
+                    self.busy -= 1
+            except Exception:
+                self.failed += 1
+                logger.exception("%s could not process %s", self.name, item)
+            else:
+                self.processed += 1
+            finally:
+                self._queue.task_done()
+
+
+def test():
+    async def run():
+        processed = []
+
+        async def process(item):
+            if item == "fail":
+                raise ValueError(item)
+            await asyncio.sleep(0.05)
+            processed.append(item)
+
+        queue = DelayQueue(process, delay=0.05, workers=2, max_size=4)
+        queue.start()
+
+        assert all(queue.put(item) for item in [1, 2, "fail", 3])
+        assert not queue.put(4)
+
+        await queue._queue.join()
+        queue.stop()
+
+        assert processed == [1, 2, 3], processed
+        print(queue.stats())
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test()
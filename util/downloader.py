@@ -0,0 +1,118 @@
+import dataclasses
+import logging
+import typing
+
+import aiohttp
+
+from util.retrying_context_manager import ReactingRetryingSession
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class DownloadResult:
+    url: typing.Any
+    # None if the download was aborted for exceeding the size cap
+    data: typing.Optional[bytes]
+    received: int
+    content_length: typing.Optional[int]
+
+    @property
+    def complete(self) -> bool:
+        return self.data is not None
+
+    @property
+    def bytes_saved(self) -> int:
+        """Bytes that were not downloaded thanks to aborting early, if the size was known."""
+        if self.complete or self.content_length is None:
+            return 0
+
+        return max(self.content_length - self.received, 0)
+
+
+class SizeCappedDownloader:
+    """
+    Downloads files of at most max_size bytes. The declared Content-Length is checked before
+    reading anything, the body is then streamed in chunks into memory, and the download is
+    aborted as soon as it exceeds the cap, which bounds the memory used.
+    Requests are retried like ReactingRetryingSession does.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        max_size: int,
+        max_tries: int = 3,
+    ):
+        self.session = session
+        self.max_size = max_size
+        self.max_tries = max_tries
+
+        self.downloads = 0
+        self.completed = 0
+        self.rejected_by_header = 0
+        self.aborted = 0
+        self.bytes_received = 0
+        self.bytes_saved = 0
+
+    async def download(self, url, message=None, emoji=None, **kwargs) -> DownloadResult:
+        """
+        Raises ExceededMaximumRetries if the file could not be requested. The result holds no
+        data if the file is larger than max_size.
+        """
+        self.downloads += 1
+
+        async with ReactingRetryingSession(
+            self.max_tries,
+            self.session.get,
+            url,
+            message=message,
+            emoji=emoji,
+            **kwargs,
+        ) as response:
+            result = await self._read_capped(url, response)
+
+        self.bytes_received += result.received
+        if result.complete:
+            self.completed += 1
+        else:
+            self.bytes_saved += result.bytes_saved
+            logger.debug(
+                "Aborted downloading '%s' after %d bytes, saved %d bytes",
+                url,
+                result.received,
+                result.bytes_saved,
+            )
+
+        return result
+
+    async def _read_capped(self, url, response) -> DownloadResult:
+        content_length = response.content_length
+
+        if content_length is not None and content_length > self.max_size:
+            self.rejected_by_header += 1
+            return DownloadResult(url, None, 0, content_length)
+
+        buffer = bytearray()
+
+        async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+            buffer += chunk
+
+            # leaving the response unread closes the connection instead of draining it
+            if len(buffer) > self.max_size:
+                self.aborted += 1
+                return DownloadResult(url, None, len(buffer), content_length)
+
+        return DownloadResult(url, bytes(buffer), len(buffer), content_length)
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "downloads": self.downloads,
+            "completed": self.completed,
+            "rejected_by_header": self.rejected_by_header,
+            "aborted": self.aborted,
+            "mb_received": round(self.bytes_received / 10**6, 2),
+            "mb_saved": round(self.bytes_saved / 10**6, 2),
+        }
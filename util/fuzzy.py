@@ -27,9 +27,103 @@ DEALINGS IN THE SOFTWARE.
 # help with: http://chairnerd.seatgeek.com/fuzzywuzzy-fuzzy-string-matching-in-python/
 
 
+import typing
+from collections import Counter
 from difflib import SequenceMatcher
 
 
 def ratio(a, b):
     m = SequenceMatcher(None, a, b)
     return int(round(100 * m.ratio()))
+
+
+class NGramIndex:
+    """
+    Inverted index from character n-grams to keys. Finds every key whose text has a ratio() with
+    a query above a threshold while only running SequenceMatcher on a handful of candidates.
+
+    The pruning is lossless. SequenceMatcher's ratio is 2M / T, where M is the number of matched
+    characters and T the combined length. M is bounded by the shorter length. The B matching
+    blocks are separated by unmatched characters, so B - 1 <= T - 2M, and a block of length k
+    shares at least k - (n - 1) n-grams. With S shared n-grams this gives
+    M <= (S + (n - 1) * (T + 1)) / (2n - 1). Keys whose bound cannot exceed the threshold are
+    skipped, keys sharing no n-gram at all are only considered where that bound allows it.
+    For thresholds around 75, bigrams are the largest n for which this bound prunes anything.
+    """
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self._texts: dict[typing.Hashable, str] = {}
+        self._grams: dict[typing.Hashable, Counter] = {}
+        self._postings: dict[str, dict[typing.Hashable, int]] = {}
+        self._lengths: dict[int, set] = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def _ngrams(self, text: str) -> Counter:
+        return Counter(text[i : i + self.n] for i in range(len(text) - self.n + 1))
+
+    def add(self, key: typing.Hashable, text: str) -> None:
+        if key in self._texts:
+            self.discard(key)
+
+        grams = self._ngrams(text)
+        self._texts[key] = text
+        self._grams[key] = grams
+        self._lengths.setdefault(len(text), set()).add(key)
+
+        for gram, count in grams.items():
+            self._postings.setdefault(gram, {})[key] = count
+
+    def discard(self, key: typing.Hashable) -> None:
+        text = self._texts.pop(key, None)
+        if text is None:
+            return
+
+        keys = self._lengths[len(text)]
+        keys.discard(key)
+        if not keys:
+            del self._lengths[len(text)]
+
+        for gram in self._grams.pop(key):
+            postings = self._postings[gram]
+            del postings[key]
+            if not postings:
+                del self._postings[gram]
+
+    def search(self, query: str, threshold: int) -> list[typing.Hashable]:
+        """
+        Returns all keys with ratio(text, query) > threshold, exactly like scanning every key.
+        """
+        query_len = len(query)
+        gaps = self.n - 1
+        divisor = 2 * gaps + 1
+
+        def can_match(length: int, shared: int) -> bool:
+            total = query_len + length
+            if total == 0:
+                return True
+
+            # ratio > threshold requires 200 * M > threshold * total, check both bounds on M
+            return (
+                200 * min(query_len, length) > threshold * total
+                and 200 * (shared + gaps * (total + 1)) > threshold * total * divisor
+            )
+
+        candidates = set()
+
+        for length, keys in self._lengths.items():
+            if can_match(length, 0):
+                candidates.update(keys)
+
+        shared = Counter()
+        for gram, count in self._ngrams(query).items():
+            for key, key_count in self._postings.get(gram, {}).items():
+                shared[key] += min(count, key_count)
+
+        for key, shared_count in shared.items():
+            if key not in candidates and can_match(len(self._texts[key]), shared_count):
+                candidates.add(key)
+
+        return [key for key in candidates if ratio(self._texts[key], query) > threshold]
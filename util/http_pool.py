@@ -0,0 +1,118 @@
+import collections
+import logging
+import ssl
+import typing
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class HttpPool:
+    """
+    One TCP connector shared by the sessions of all cogs, so they share a keep-alive pool, a DNS
+    cache and an SSL context instead of each setting up their own. Cogs borrow sessions from it
+    and close them on unload, which leaves the connector open. The connector is created lazily
+    since it needs a running event loop.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30.0,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+
+        self._connector: typing.Optional[aiohttp.TCPConnector] = None
+        self._ssl_context = ssl.create_default_context()
+        self._trace_config = self._create_trace_config()
+
+        self.requests = collections.Counter()  # host -> requests
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.queued = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    @property
+    def connector(self) -> aiohttp.TCPConnector:
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+                ssl=self._ssl_context,
+            )
+
+        return self._connector
+
+    def session(self, **kwargs) -> aiohttp.ClientSession:
+        """Returns a new session on the shared connector, closing it leaves the connector open."""
+        return aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            trace_configs=[self._trace_config],
+            **kwargs,
+        )
+
+    async def close(self) -> None:
+        if self._connector is not None:
+            await self._connector.close()
+
+    def _create_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.requests[params.url.host] += 1
+
+        async def on_connection_create_end(session, context, params):
+            self.new_connections += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.reused_connections += 1
+
+        async def on_connection_queued_start(session, context, params):
+            self.queued += 1
+
+        async def on_dns_cache_hit(session, context, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, context, params):
+            self.dns_cache_misses += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+
+        return trace_config
+
+    def stats(self) -> dict[str, typing.Any]:
+        connections = self.new_connections + self.reused_connections
+        # the connector does not expose how many connections are in use
+        in_use = len(self._connector._acquired) if self._connector else 0
+
+        return {
+            "requests": sum(self.requests.values()),
+            "busiest_hosts": ", ".join(
+                f"{host} ({count})" for host, count in self.requests.most_common(3)
+            )
+            or "-",
+            "connections_in_use": f"{in_use}/{self.limit}",
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_rate": f"{self.reused_connections / connections:.1%}"
+            if connections
+            else "-",
+            "queued_for_limit": self.queued,
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses,
+        }
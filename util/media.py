@@ -0,0 +1,133 @@
+import io
+import typing
+
+import discord
+
+
+class MemoryViewReader(io.RawIOBase):
+    """Read-only, seekable file over a buffer that never copies the buffer as a whole."""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._view[self._position : self._position + len(b)]
+        b[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = len(self._view) + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+
+        self._position = max(self._position, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class MediaBuffer:
+    """
+    A downloaded media file that is sent to several channels. The data (bytes or a memory map of
+    a cached file) is immutable and shared, every send gets its own discord.File reading from
+    the same buffer, so no send copies the file.
+    """
+
+    __slots__ = ("filename", "data")
+
+    def __init__(self, filename: str, data: typing.Union[bytes, typing.Any]):
+        self.filename = filename
+        self.data = data
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def to_file(self, spoiler: bool = False) -> discord.File:
+        return discord.File(MemoryViewReader(self.data), self.filename, spoiler=spoiler)
+
+    def __repr__(self):
+        return f"<MediaBuffer=(filename={self.filename},size={self.size})>"
+
+
+MAX_ATTACHMENTS = 10
+
+
+def pack_attachments(
+    files: list[MediaBuffer], max_bytes: int, max_files: int = MAX_ATTACHMENTS
+) -> list[list[MediaBuffer]]:
+    """
+    Groups files into as few messages as possible while keeping their order, each message with
+    at most max_files files of at most max_bytes in total. Filling every message greedily is
+    optimal when the order has to be kept. A file larger than max_bytes is sent on its own.
+    """
+    messages = []
+    current = []
+    current_bytes = 0
+
+    for file in files:
+        if current and (
+            len(current) >= max_files or current_bytes + file.size > max_bytes
+        ):
+            messages.append(current)
+            current = []
+            current_bytes = 0
+
+        current.append(file)
+        current_bytes += file.size
+
+    if current:
+        messages.append(current)
+
+    return messages
+
+
+def benchmark():
+    import random
+
+    random.seed(0)
+    max_bytes = 25 * 2**20
+
+    posts = [
+        [
+            MediaBuffer(f"{i}.jpg", bytes(random.randint(10**5, 8 * 10**6)))
+            for i in range(random.randint(1, 10))
+        ]
+        for _ in range(200)
+    ]
+
+    unpacked = sum(len(post) for post in posts)
+    packed = sum(len(pack_attachments(post, max_bytes)) for post in posts)
+
+    for post in posts:
+        messages = pack_attachments(post, max_bytes)
+        assert [file for message in messages for file in message] == post
+        assert all(
+            len(message) <= MAX_ATTACHMENTS
+            and (len(message) == 1 or sum(f.size for f in message) <= max_bytes)
+            for message in messages
+        )
+
+    print(
+        f"{len(posts)} posts: {unpacked / len(posts):.2f} messages per post with one file "
+        f"per message, {packed / len(posts):.2f} packed"
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,271 @@
+import asyncio
+import collections
+import dataclasses
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import typing
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from util.media import MediaBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_media_url(url, drop_query: bool = False) -> str:
+    """
+    Normalizes a media URL into a cache key. Query parameters are sorted, or dropped entirely
+    for CDNs that sign their URLs per request.
+    """
+    parts = urlsplit(str(url))
+    query = "" if drop_query else urlencode(sorted(parse_qsl(parts.query)))
+
+    return urlunsplit(("https", parts.netloc.lower(), parts.path, query, ""))
+
+
+@dataclasses.dataclass
+class _Entry:
+    digest: str
+    size: int
+    filename: str
+
+
+class MediaCache:
+    """
+    Disk-backed LRU cache of media files with a byte budget. Files are stored once per SHA-256
+    of their content, so identical media behind different URLs share a file. Writes go to a
+    temporary file that is renamed into place, reads memory map the file instead of loading it.
+
+    The key index is saved to the directory in the background after every store, so it
+    survives a crash.
+    """
+
+    INDEX_FILE = "index.json"
+    # names of files the cache writes, others in the directory are left alone
+    FILE_REGEX = re.compile(r"[0-9a-f]{64}|.+\.tmp")
+
+    def __init__(self, directory: str, max_bytes: int, name: str = "media cache"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+
+        self._entries: collections.OrderedDict[str, _Entry] = collections.OrderedDict()
+        # how many keys point at each stored file
+        self._refs: collections.Counter[str] = collections.Counter()
+        self._sizes: dict[str, int] = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self._save_lock = asyncio.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def get(self, key: str) -> typing.Optional[MediaBuffer]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            with open(self._path(entry.digest), "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # the file vanished or is empty, forget about it
+            logger.warning("%s lost the file of %s", self.name, key)
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return MediaBuffer(entry.filename, data)
+
+    async def put(self, key: str, filename: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        digest = hashlib.sha256(data).hexdigest()
+
+        if (entry := self._entries.get(key)) is not None and entry.digest == digest:
+            entry.filename = filename
+            self._entries.move_to_end(key)
+            return
+
+        if digest not in self._sizes:
+            await asyncio.to_thread(self._write, digest, data)
+
+        # reference the new file before the old entry can drop the last reference to it
+        self._refs[digest] += 1
+        if digest not in self._sizes:
+            self._sizes[digest] = len(data)
+            self.bytes += len(data)
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = _Entry(digest, len(data), filename)
+
+        self.stores += 1
+        self._evict()
+
+        # the index is taken here, since the entries may change while the thread writes it
+        async with self._save_lock:
+            await asyncio.to_thread(self._write_index, self._index())
+
+    def _write(self, digest: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(digest))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._refs[entry.digest] -= 1
+
+        if self._refs[entry.digest] <= 0:
+            del self._refs[entry.digest]
+            self.bytes -= self._sizes.pop(entry.digest)
+
+            # memory maps of the file stay valid after it is unlinked
+            try:
+                os.unlink(self._path(entry.digest))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def save_index(self) -> None:
+        self._write_index(self._index())
+
+    def _index(self) -> list:
+        return [
+            [key, entry.digest, entry.size, entry.filename]
+            for key, entry in self._entries.items()
+        ]
+
+    def _write_index(self, index: list) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, os.path.join(self.directory, self.INDEX_FILE))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _load_index(self) -> None:
+        path = os.path.join(self.directory, self.INDEX_FILE)
+
+        try:
+            with open(path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = []
+
+        for key, digest, size, filename in index:
+            try:
+                if os.path.getsize(self._path(digest)) != size:
+                    continue
+            except OSError:
+                continue
+
+            self._entries[key] = _Entry(digest, size, filename)
+            self._refs[digest] += 1
+            if digest not in self._sizes:
+                self._sizes[digest] = size
+                self.bytes += size
+
+        # remove files that are no longer referenced and leftovers of interrupted writes
+        for name in os.listdir(self.directory):
+            if self.FILE_REGEX.fullmatch(name) and name not in self._sizes:
+                os.unlink(os.path.join(self.directory, name))
+
+        self._evict()
+        logger.info(
+            "%s loaded %d entries (%d bytes)", self.name, len(self._entries), self.bytes
+        )
+
+    def stats(self) -> dict[str, typing.Any]:
+        lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self._entries),
+            "files": len(self._sizes),
+            "mb_used": round(self.bytes / 10**6, 2),
+            "mb_budget": round(self.max_bytes / 10**6, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{self.hits / lookups:.1%}" if lookups else "-",
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+def test():
+    async def run(directory):
+        cache = MediaCache(directory, max_bytes=25)
+
+        assert cache.get("a") is None
+        await cache.put("a", "a.jpg", b"0123456789")
+        await cache.put("b", "b.jpg", b"0123456789")  # same content, shares the file
+        assert cache.bytes == 10 and cache.stats()["files"] == 1
+
+        await cache.put(
+            "b", "b.jpg", b"0123456789"
+        )  # storing a key again keeps its file
+        assert cache.get("b") is not None and cache.stats()["files"] == 1
+
+        media = cache.get("a")
+        assert media.filename == "a.jpg" and media.to_file().fp.read() == b"0123456789"
+
+        await cache.put("c", "c.jpg", b"abcdefghij")
+        await cache.put(
+            "d", "d.jpg", b"ABCDEFGHIJ"
+        )  # evicts b, then the shared file with a
+        assert cache.get("a") is None and cache.get("b") is None
+        assert cache.get("c") is not None and cache.bytes == 20
+
+        # not a file of the cache, survives loading
+        with open(os.path.join(directory, "notes.txt"), "w") as f:
+            f.write("keep me")
+
+        # the index was saved by the stores, as if the bot crashed
+        reloaded = MediaCache(directory, max_bytes=25)
+        assert reloaded.get("d").to_file().fp.read() == b"ABCDEFGHIJ"
+        assert sorted(os.listdir(directory)) == sorted(
+            [MediaCache.INDEX_FILE, "notes.txt", *reloaded._sizes]
+        )
+
+        print(cache.stats())
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+if __name__ == "__main__":
+    test()
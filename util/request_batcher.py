@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import typing
+
+from util.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+Key = typing.Hashable
+
+
+class RequestBatcher:
+    """
+    Coalesces lookups of single keys into batched calls of fetch. Keys requested within
+    max_delay seconds of the first pending one are fetched together, a batch is sent early once
+    max_batch_size keys are pending. Concurrent lookups of the same key share one result.
+
+    fetch receives a list of keys and returns a dict mapping them to their results, keys missing
+    from it resolve to None. If fetch raises, every lookup of the batch raises the same exception.
+    """
+
+    def __init__(
+        self,
+        fetch: typing.Callable[[list], typing.Awaitable[dict]],
+        max_batch_size: int = 100,
+        max_delay: float = 0.05,
+    ):
+        self._fetch = fetch
+        self._pending: dict[Key, asyncio.Future] = {}
+        self._lookups = SingleFlight()
+        self._timer: typing.Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.requested = 0
+        self.batches = 0
+        self.fetched = 0
+
+    async def get(self, key: Key):
+        self.requested += 1
+        return await self._lookups.run(key, self._lookup, key)
+
+    async def _lookup(self, key: Key):
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self._flush
+            )
+
+        return await future
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "requested": self.requested,
+            "fetched": self.fetched,
+            "batches": self.batches,
+            "pending": len(self._pending),
+        }
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, {}
+
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict[Key, asyncio.Future]) -> None:
+        self.batches += 1
+        self.fetched += len(batch)
+
+        try:
+            results = await self._fetch(list(batch))
+        except Exception as e:
+            logger.debug("Fetching a batch of %d keys failed", len(batch))
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(results.get(key))
+
+
+def test():
+    async def run():
+        calls = []
+
+        async def fetch(keys):
+            calls.append(keys)
+            await asyncio.sleep(0.01)
+            return {key: key * 2 for key in keys if key != 3}
+
+        batcher = RequestBatcher(fetch, max_batch_size=4, max_delay=0.01)
+
+        results = await asyncio.gather(*[batcher.get(key) for key in [1, 2, 2, 3]])
+        assert results == [2, 4, 4, None], results
+        assert calls == [[1, 2, 3]], calls
+
+        results = await asyncio.gather(*[batcher.get(key) for key in range(6)])
+        assert results == [0, 2, 4, None, 8, 10], results
+        assert calls[1:] == [[0, 1, 2, 3], [4, 5]], calls
+
+        print(batcher.stats())
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test()
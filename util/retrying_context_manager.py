@@ -1,5 +1,10 @@
 import asyncio
+import enum
 import logging
+import random
+import time
+import typing
+from urllib.parse import urlsplit
 
 import aiohttp
 
@@ -15,14 +20,144 @@ class ExceededMaximumRetries(Exception):
         self.tries = tries
 
 
+class CircuitOpenError(ExceededMaximumRetries):
+    """Raised without requesting the URL, since its host has been failing recently."""
+
+    def __init__(self, url, tries, host):
+        Exception.__init__(
+            self, f"Not fetching '{url}' since requests to '{host}' keep failing"
+        )
+        self.url = url
+        self.tries = tries
+        self.host = host
+
+
 class _RetryException(Exception):
     pass
 
 
+class BreakerState(enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, after which requests fail without being
+    made. Once recovery_timeout seconds have passed a single probe request is let through
+    (half-open), which closes the breaker if it succeeds and opens it again otherwise.
+    """
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == BreakerState.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+
+            self.state = BreakerState.HALF_OPEN
+
+        if self.state == BreakerState.HALF_OPEN:
+            if self._probing:
+                return False
+
+            self._probing = True
+
+        return True
+
+    def record_success(self) -> None:
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+
+        if (
+            self.state == BreakerState.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.state != BreakerState.OPEN:
+                self.times_opened += 1
+                logger.warning(
+                    "Circuit breaker opened after %d failures",
+                    self.consecutive_failures,
+                )
+
+            self.state = BreakerState.OPEN
+            self.opened_at = time.monotonic()
+
+        self._probing = False
+
+    def release(self) -> None:
+        """Lets another probe through if one ended without an outcome, e.g. by cancellation."""
+        self._probing = False
+
+
+class _HostState:
+    def __init__(
+        self, max_in_flight: int, failure_threshold: int, recovery_timeout: float
+    ):
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.max_in_flight = max_in_flight
+
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.fast_failures = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.max_in_flight - self.semaphore._value
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "state": self.breaker.state.value,
+            "times_opened": self.breaker.times_opened,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "in_flight": f"{self.in_flight}/{self.max_in_flight}",
+            "requests": self.requests,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+            "fast_failures": self.fast_failures,
+        }
+
+
+_hosts: dict[str, _HostState] = {}
+
+
+def host_stats() -> dict[str, dict[str, typing.Any]]:
+    """Breaker state and retry counters of every host requested through a RetryingSession."""
+    return {host: state.stats() for host, state in _hosts.items()}
+
+
 class RetryingSession:
+    """
+    Requests a URL up to max_tries times with full-jitter exponential backoff. Every host has a
+    circuit breaker shared by all sessions, so requests to a host that keeps failing raise
+    CircuitOpenError right away instead of waiting through their retries, and a limit on
+    requests in flight, held from sending a request until the response is released.
+    """
+
     DELAY_BASE = 2
     TIMEOUT = 10
 
+    MAX_IN_FLIGHT_PER_HOST = 10
+    FAILURE_THRESHOLD = 5
+    RECOVERY_TIMEOUT = 30
+
     def __init__(self, max_tries, method, url, *args, **kwargs):
         self.max_tries = max_tries
         self.method = method
@@ -32,11 +167,32 @@ class RetryingSession:
         self.context_manager = None
         self.last_exception = None
 
+        self.host = urlsplit(str(url)).hostname or ""
+        if (host_state := _hosts.get(self.host)) is None:
+            host_state = _hosts[self.host] = _HostState(
+                self.MAX_IN_FLIGHT_PER_HOST,
+                self.FAILURE_THRESHOLD,
+                self.RECOVERY_TIMEOUT,
+            )
+        self.host_state = host_state
+
     async def on_retry(self):
         """Override to specify behavior on the first retry attempt."""
         pass
 
     async def _do_request(self):
+        breaker = self.host_state.breaker
+
+        try:
+            await self.host_state.semaphore.acquire()
+        except BaseException:
+            # cancelled while waiting for a slot, possibly as the probe of the breaker
+            breaker.release()
+            raise
+
+        self.host_state.attempts += 1
+        outcome_recorded = False
+
         try:
             self.context_manager = self.method(self.url, *self.args, **self.kwargs)
 
@@ -50,15 +206,46 @@ class RetryingSession:
                     self.url,
                     resp.status,
                 )
+                # other error statuses mean that the host itself is responding
+                if resp.status == 429 or resp.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                outcome_recorded = True
+
+                await self.context_manager.__aexit__(None, None, None)
                 raise _RetryException
 
+            breaker.record_success()
             return resp
+        except _RetryException:
+            self.host_state.semaphore.release()
+            raise
         except Exception as e:
+            if not outcome_recorded:
+                # other errors, like an invalid URL, say nothing about the host
+                if isinstance(e, (asyncio.TimeoutError, aiohttp.ClientConnectionError)):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+            self.host_state.semaphore.release()
             self.last_exception = e
             raise _RetryException from e
+        except BaseException:
+            # cancelled
+            if not outcome_recorded:
+                breaker.release()
+            self.host_state.semaphore.release()
+            raise
 
     async def __aenter__(self):
+        self.host_state.requests += 1
+
         for current_try in range(self.max_tries):
+            if not self.host_state.breaker.allow():
+                self.host_state.fast_failures += 1
+                raise CircuitOpenError(self.url, current_try, self.host)
+
             try:
                 return await self._do_request()
             except _RetryException:
@@ -66,12 +253,15 @@ class RetryingSession:
                     asyncio.create_task(self.on_retry())
 
                 if current_try < self.max_tries - 1:
-                    delay = self.DELAY_BASE**current_try
+                    self.host_state.retries += 1
+                    delay = random.uniform(0, self.DELAY_BASE**current_try)
                     logger.info(
-                        "Waiting %d seconds before retrying '%s'", delay, self.url
+                        "Waiting %.2f seconds before retrying '%s'", delay, self.url
                     )
                     await asyncio.sleep(delay)
         else:
+            self.host_state.exhausted += 1
+
             if self.last_exception:
                 raise ExceededMaximumRetries(
                     self.url, self.max_tries
@@ -80,7 +270,10 @@ class RetryingSession:
                 raise ExceededMaximumRetries(self.url, self.max_tries)
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        return await self.context_manager.__aexit__(exc_type, exc_val, exc_tb)
+        try:
+            return await self.context_manager.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.host_state.semaphore.release()
 
 
 class ReactingRetryingSession(RetryingSession):
@@ -115,5 +308,60 @@ async def _test():
     await session.close()
 
 
+async def _test_circuit_breaker():
+    class FailingSession(RetryingSession):
+        DELAY_BASE = 0.01
+        FAILURE_THRESHOLD = 3
+        RECOVERY_TIMEOUT = 0.1
+
+    def fail(url):
+        raise aiohttp.ClientConnectionError(url)
+
+    url = "https://example.invalid/"
+
+    for expected in [ExceededMaximumRetries, CircuitOpenError]:
+        try:
+            async with FailingSession(3, fail, url):
+                pass
+        except ExceededMaximumRetries as e:
+            assert type(e) == expected, e
+
+    assert host_stats()["example.invalid"]["state"] == "open"
+    await asyncio.sleep(0.1)
+
+    # a probe cancelled while waiting for a slot lets the next probe through
+    host_state = _hosts["example.invalid"]
+    for _ in range(host_state.max_in_flight):
+        await host_state.semaphore.acquire()
+
+    probe = asyncio.create_task(FailingSession(1, fail, url).__aenter__())
+    await asyncio.sleep(0)
+    assert not host_state.breaker.allow()
+
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    for _ in range(host_state.max_in_flight):
+        host_state.semaphore.release()
+
+    assert host_state.breaker.allow()  # the probe
+    assert not host_state.breaker.allow()
+
+    # errors of the client say nothing about the host
+    def invalid(url):
+        raise ValueError(url)
+
+    for _ in range(2):
+        try:
+            async with FailingSession(3, invalid, "https://client.invalid/"):
+                pass
+        except ExceededMaximumRetries as e:
+            assert type(e) == ExceededMaximumRetries, e
+
+    assert host_stats()["client.invalid"]["state"] == "closed"
+
+    print(host_stats())
+
+
 if __name__ == "__main__":
+    asyncio.run(_test_circuit_breaker())
     asyncio.run(_test())
@@ -0,0 +1,110 @@
+import asyncio
+import typing
+
+Key = typing.Hashable
+
+
+class SingleFlight:
+    """
+    Shares one running call per key between everyone asking for that key. A caller that is
+    cancelled does not cancel the call for the others.
+
+    A key is forgotten as soon as its call finishes, unless keep is set. Then it stays until
+    forget is called, so later callers get the result of the same call too.
+    """
+
+    def __init__(self, keep: bool = False):
+        self._tasks: dict[Key, asyncio.Task] = {}
+        self.keep = keep
+
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._tasks
+
+    def start(self, key: Key, func, *args, **kwargs) -> asyncio.Task:
+        """Calls func in the background, unless a call for key is already running or kept."""
+        if (task := self._tasks.get(key)) is not None:
+            self.shared += 1
+            return task
+
+        self.calls += 1
+        task = asyncio.create_task(func(*args, **kwargs))
+        self._tasks[key] = task
+
+        if not self.keep:
+            task.add_done_callback(lambda _: self._drop(key, task))
+
+        return task
+
+    async def run(self, key: Key, func, *args, **kwargs):
+        return await self.wait(self.start(key, func, *args, **kwargs))
+
+    @staticmethod
+    async def wait(task: asyncio.Task):
+        return await asyncio.shield(task)
+
+    def forget(self, key: Key, task: asyncio.Task) -> None:
+        """Drops the call of key if it is task, once it finishes if it is still running."""
+        if task.done():
+            self._drop(key, task)
+        else:
+            task.add_done_callback(lambda _: self._drop(key, task))
+
+    def _drop(self, key: Key, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "running": len(self._tasks),
+            "calls": self.calls,
+            "shared": self.shared,
+        }
+
+
+def test():
+    async def run():
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key * 2
+
+        flight = SingleFlight()
+
+        # a cancelled caller leaves the call running for the others
+        cancelled = asyncio.create_task(flight.run(1, fetch, 1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        results = await asyncio.gather(
+            *[flight.run(key, fetch, key) for key in [1, 1, 2]]
+        )
+        assert results == [2, 2, 4] and calls == [1, 2], calls
+
+        await asyncio.sleep(0)
+        assert len(flight) == 0
+        await flight.run(1, fetch, 1)
+        assert calls == [1, 2, 1], calls
+
+        kept = SingleFlight(keep=True)
+        task = kept.start("a", fetch, "a")
+        assert await kept.wait(task) == "aa"
+        assert await kept.run("a", fetch, "a") == "aa" and calls.count("a") == 1
+
+        kept.forget("a", task)
+        assert "a" not in kept
+
+        print(flight.stats(), kept.stats())
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test()
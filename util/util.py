@@ -2,6 +2,7 @@ import asyncio
 import logging
 import re
 import subprocess
+import sys
 import typing
 from random import getrandbits
 
@@ -81,6 +82,38 @@ def flatten(list_):
     return [item for sublist in list_ for item in sublist]
 
 
+def deep_getsizeof(obj, seen=None) -> int:
+    """
+    Approximates the memory used by an object graph in bytes by recursing into containers,
+    instance dicts and slots. Objects referenced multiple times are only counted once.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    elif isinstance(obj, dict):
+        size += sum(
+            deep_getsizeof(key, seen) + deep_getsizeof(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += deep_getsizeof(vars(obj), seen)
+
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += deep_getsizeof(getattr(obj, slot), seen)
+
+    return size
+
+
 def git_version_label():
     return (
         subprocess.check_output(["git", "describe", "--tags", "--long"])